@@ -1,10 +1,11 @@
 # -*- coding: utf-8 -*-
 
 import falcon
-import json
+from contextlib import closing
 
 from conf.config import APP_NAME, LOG
 from utils.errors import generic_error_handler
+from utils.json_codec import dumps
 
 class BaseResource(object):
     BASE_TEMPLATE = {
@@ -12,7 +13,7 @@ class BaseResource(object):
     }
 
     def to_json(self, body_dict):
-        return json.dumps(body_dict)
+        return dumps(body_dict).decode('utf-8')
 
     def on_created(self, res, data=None):
         res.status = falcon.HTTP_201
@@ -49,6 +50,30 @@ class BaseResource(object):
         }
         res.json = data_dic
 
+    def on_stream(self, res, chunks):
+        """Streams a listing chunk by chunk instead of building `res.json`.
+
+        The envelope matches `on_paginate`, with `count` written once every
+        item has been sent.
+        """
+        res.status = falcon.HTTP_200
+        res.content_type = falcon.MEDIA_JSON
+        res.stream = self.stream_items(chunks)
+
+    def stream_items(self, chunks):
+        count = 0
+        yield b'{"items": ['
+        with closing(chunks):
+            for chunk in chunks:
+                fragment = b', '.join(dumps(item) for item in chunk)
+                yield (b', ' if count else b'') + fragment
+                count += len(chunk)
+        meta = {
+            'code': 200,
+            'message': 'OK'
+        }
+        yield b'], "count": %d, "next": null, "meta": %s}' % (count, dumps(meta))
+
     def on_get(self, req, res, **kwargs):
         if req.path in ['/', '/healthcheck']:
             res.status = falcon.HTTP_200
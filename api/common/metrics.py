@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+
+import falcon
+
+from api.common.base import BaseResource
+from utils.metrics import metrics
+
+class Metrics(BaseResource):
+    """
+    Handle for endpoint: /metrics
+    """
+    # Prometheus text exposition format.
+    media_types = ['text/plain']
+
+    def on_get(self, req, res):
+        res.status = falcon.HTTP_200
+        res.content_type = 'text/plain; version=0.0.4; charset=utf-8'
+        res.body = metrics.render()
@@ -3,22 +3,77 @@
 # Standard python libraries
 import falcon
 import uuid
+import csv
+import io
 import json
+import sqlite3
 from collections import OrderedDict
-from contextlib import suppress
+from contextlib import closing, suppress
 
 from api.common import BaseResource
-from conf.config import LOG, SUPER_ADMIN_KEY
+from conf.config import (LOG, SUPER_ADMIN_KEY, PAGE_SIZE_DEFAULT, PAGE_SIZE_MAX, STREAM_CHUNK_SIZE,
+                         BATCH_CHUNK_SIZE)
 from db_ import database as db
+from middleware.convert_to_json import validate
 from middleware.jwt_authentication import validate_token
-from utils.errors import generic_error_handler
+from utils.errors import generic_error_handler, CustomeHTTPError
 from utils.hashing_tools import make_password_hashing, checking_password_hash
 from utils.jwt_module import jwt_payload_handler
+from utils.json_codec import dumps, loads
+from utils.pagination import encode_cursor, decode_cursor
+
+# Validation rules for new astronauts, shared by single and batch creation.
+ASTRONAUT_RULES = OrderedDict([
+    ('firstName', {'dtype': str, 'min': 3, 'max': 20}),
+    ('lastName', {'dtype': str, 'min': 3, 'max': 20}),
+    ('hoursInSpace', {'dtype': int, 'min': 0}),
+    ('picture', {'dtype': str, 'min': 3}),
+])
+
+def check_filters(req, params):
+    """ answers 400 for list filters that do not compile, e.g. hoursInSpace[gte]=abc,
+        before anything is streamed
+    """
+    try:
+        db.build_filters(params)
+    except ValueError as ex:
+        error = {
+            'description': 'Invalid filter',
+            'details': str(ex)
+        }
+        LOG.error(error)
+        raise generic_error_handler(400, req=req, error_override=error)
+
+def lookup_astronauts(req, ids):
+    """ the listing envelope for a lookup by id, with the ids that don't exist
+        under 'missing'
+    :param ids: list of ids, or a comma separated string
+    """
+    if isinstance(ids, str):
+        ids = ids.split(",")
+    if not isinstance(ids, list) or not all(isinstance(id_, str) and id_ for id_ in ids):
+        error = {
+            'description': 'Invalid ids',
+            'details': "'ids' needs to be a list of astronaut ids"
+        }
+        LOG.error(error)
+        raise generic_error_handler(400, req=req, error_override=error)
+    if not 1 <= len(ids) <= PAGE_SIZE_MAX:
+        error = {
+            'description': 'Invalid ids',
+            'details': f"'ids' needs between 1 and {PAGE_SIZE_MAX} ids"
+        }
+        LOG.error(error)
+        raise generic_error_handler(400, req=req, error_override=error)
+    astronauts, missing = db.fetch_astronauts_by_ids(ids)
+    return {'count': len(astronauts), 'items': astronauts, 'missing': missing}
 
 class List(BaseResource):
     """
     Handle for endpoint: /api/credentials
     """
+    etag_table = 'astronauts'
+
     def __init__(self, **kwargs):
         """ Creates a client instance """
         super(List, self).__init__(**kwargs)
@@ -26,11 +81,68 @@ class List(BaseResource):
     @falcon.before(validate_token)
     def on_get(self, req, res):
         params = req.params
+        if 'ids' in params:
+            # Many astronauts by id, e.g. ?ids=a,b,c; see Lookup for long lists.
+            ids = params['ids']
+            if isinstance(ids, list):
+                ids = ",".join(ids)
+            self.on_paginate(res, lookup_astronauts(req, ids))
+            return
         if params.get('id'):
             params['id_'] = params['id'] 
-        astronauts = db.fetch_astronauts(filters=params)
-        data = {'count': len(astronauts), 'items': astronauts}
-        self.on_success(res, data)
+        check_filters(req, params)
+        if params.get('stream') == 'true':
+            # Every matching row, written as it is read from SQLite.
+            self.on_stream(res, db.iter_astronauts(filters=params, chunk_size=STREAM_CHUNK_SIZE))
+            return
+        if params.get('q'):
+            # Name search: the best `limit` matches, ranked, without a cursor.
+            limit, _, _ = self.page_params(req)
+            astronauts = db.search_astronauts(params['q'], filters=params, limit=limit)
+            self.on_paginate(res, {'count': len(astronauts), 'items': astronauts, 'next': None})
+            return
+        limit, after, sort = self.page_params(req)
+        # One extra row tells us whether there is a next page.
+        astronauts = db.fetch_astronauts(filters=params, limit=limit + 1, after=after, sort=sort)
+        next_cursor = None
+        if len(astronauts) > limit:
+            astronauts = astronauts[:limit]
+            last = astronauts[-1]
+            next_cursor = encode_cursor(sort, [last['id' if c == 'id_' else c] for c in db.sort_columns(sort)])
+        data = {'count': len(astronauts), 'items': astronauts, 'next': next_cursor}
+        self.on_paginate(res, data)
+
+    def page_params(self, req):
+        """ :return: (limit, after, sort) where sort is normalized for db.parse_sort,
+            e.g. ?sort=-id -> '-id_', and after are the cursor values for that sort
+        """
+        try:
+            limit = int(req.params.get('limit', PAGE_SIZE_DEFAULT))
+            sort = req.params.get('sort') or 'id_'
+            if sort.lstrip('-') == 'id':
+                sort += '_'
+            db.parse_sort(sort)
+            after = None
+            if req.params.get('cursor'):
+                cursor_sort, values = decode_cursor(req.params['cursor'])
+                if cursor_sort != sort or len(values) != len(db.sort_columns(sort)):
+                    raise ValueError(f"Invalid cursor for sort {sort}: {req.params['cursor']}")
+                after = values
+        except ValueError as ex:
+            error = {
+                'description': 'Invalid pagination',
+                'details': str(ex)
+            }
+            LOG.error(error)
+            raise generic_error_handler(400, req=req, error_override=error)
+        if not 1 <= limit <= PAGE_SIZE_MAX:
+            error = {
+                'description': 'Invalid pagination',
+                'details': f"'limit' needs to be between 1 and {PAGE_SIZE_MAX}"
+            }
+            LOG.error(error)
+            raise generic_error_handler(400, req=req, error_override=error)
+        return limit, after, sort
     
     @falcon.before(validate_token)
     def on_post(self, req, res):
@@ -48,11 +160,11 @@ class List(BaseResource):
         astronaut = {
             'id': str(uuid.uuid4()),
             'active': True,
-            'firstName': req.get_json('firstName', dtype=str, min=3, max=20),
-            'lastName': req.get_json('lastName', dtype=str, min=3, max=20),
+            'firstName': req.get_json('firstName', **ASTRONAUT_RULES['firstName']),
+            'lastName': req.get_json('lastName', **ASTRONAUT_RULES['lastName']),
             'skills': skills,
-            'hoursInSpace': req.get_json('hoursInSpace', dtype=int, min=0),
-            'picture': req.get_json('picture', dtype=str, min=3)
+            'hoursInSpace': req.get_json('hoursInSpace', **ASTRONAUT_RULES['hoursInSpace']),
+            'picture': req.get_json('picture', **ASTRONAUT_RULES['picture'])
         }
         
         try:
@@ -66,10 +178,224 @@ class List(BaseResource):
 
         self.on_created(res, astronaut)
 
+class Batch(BaseResource):
+    """
+    Handle for endpoint: /api/astronauts/batch
+    """
+    def __init__(self, **kwargs):
+        """ Creates a client instance """
+        super(Batch, self).__init__(**kwargs)
+
+    @falcon.before(validate_token)
+    def on_post(self, req, res):
+        """Creates many astronauts from a JSON array or an NDJSON body.
+
+        Rows are validated like POST /api/astronauts and inserted
+        BATCH_CHUNK_SIZE at a time; invalid or conflicting rows are reported
+        by position without stopping the others.
+        """
+        if 'application/x-ndjson' in req.content_type:
+            rows = self.read_ndjson(req.bounded_stream)
+        else:
+            rows = req.json
+            if not isinstance(rows, list):
+                error = {
+                    'description': 'invalid payload',
+                    'details': "payload needs to be an array of astronauts"
+                }
+                LOG.error(error)
+                raise generic_error_handler(400, req=req, error_override=error)
+
+        created, errors = [], []
+        chunk, positions = [], []
+        for position, row in enumerate(rows):
+            try:
+                chunk.append(self.make_astronaut(row))
+                positions.append(position)
+            except CustomeHTTPError as ex:
+                errors.append(self.row_error(position, ex.error['meta']))
+            if len(chunk) == BATCH_CHUNK_SIZE:
+                self.insert(chunk, positions, created, errors)
+                chunk, positions = [], []
+        if chunk:
+            self.insert(chunk, positions, created, errors)
+
+        errors.sort(key=lambda error: error['index'])
+        data = {'created': len(created), 'failed': len(errors), 'ids': created, 'errors': errors}
+        if not created and errors:
+            error = {
+                'description': 'No astronaut was created',
+                'details': errors
+            }
+            LOG.error(error)
+            raise generic_error_handler(400, req=req, error_override=error)
+        self.on_created(res, data)
+
+    def read_ndjson(self, stream, block_size=64 * 1024):
+        pending = b''
+        while True:
+            block = stream.read(block_size)
+            if not block:
+                break
+            lines = (pending + block).split(b'\n')
+            pending = lines.pop()
+            for line in lines:
+                if line.strip():
+                    yield line
+        if pending.strip():
+            yield pending
+
+    def make_astronaut(self, row):
+        if isinstance(row, bytes):
+            try:
+                row = loads(row.decode('utf-8'))
+            except ValueError:
+                raise generic_error_handler(400, error_override={'description': 'Malformed JSON'})
+        if not isinstance(row, dict):
+            raise generic_error_handler(400, error_override={'description': 'astronaut needs to be an object'})
+        skills = row.get('skills')
+        if not isinstance(skills, list) or not all(isinstance(skill, str) and skill for skill in skills):
+            error = {
+                'description': 'invalid skills',
+                'details': f"'skills' field needs to be an array/list of non-empty strings"
+            }
+            raise generic_error_handler(400, error_override=error)
+
+        astronaut = {'id': str(uuid.uuid4()), 'active': True, 'skills': row['skills']}
+        for field, rules in ASTRONAUT_RULES.items():
+            if field not in row:
+                error = {
+                    'description': 'Missing JSON field',
+                    'details': f"Field '{field}' is required"}
+                raise generic_error_handler(400, error_override=error)
+            astronaut[field] = validate(field, row[field], **rules)
+        return astronaut
+
+    def insert(self, chunk, positions, created, errors):
+        try:
+            failed = dict(db.insert_astronauts_batch(chunk))
+        except Exception as ex:
+            # Conflicts come back in the result; anything else fails the whole
+            # chunk, so find the rows causing it, one transaction each.
+            LOG.error(f"Batch insert of {len(chunk)} astronauts failed, retrying row by row: {ex}")
+            failed = {}
+            for offset, astronaut in enumerate(chunk):
+                try:
+                    failed.update((offset, error) for _, error in db.insert_astronauts_batch([astronaut]))
+                except Exception as ex:
+                    failed[offset] = str(ex)
+        for offset, astronaut in enumerate(chunk):
+            if offset in failed:
+                errors.append(self.row_error(positions[offset], {'description': failed[offset]}))
+            else:
+                created.append(astronaut['id'])
+
+    def row_error(self, position, meta):
+        error = {'index': position, 'description': meta.get('description')}
+        if meta.get('details'):
+            error['details'] = meta['details']
+        return error
+
+class Lookup(BaseResource):
+    """
+    Handle for endpoint: /api/astronauts/lookup
+    """
+    def __init__(self, **kwargs):
+        """ Creates a client instance """
+        super(Lookup, self).__init__(**kwargs)
+
+    @falcon.before(validate_token)
+    def on_post(self, req, res):
+        """Same as GET /api/astronauts?ids=a,b,c with the ids in the body,
+        `{"ids": ["a", "b", "c"]}`, for lists too long for a URL.
+        """
+        self.on_paginate(res, lookup_astronauts(req, req.get_json('ids', dtype=list)))
+
+class Export(BaseResource):
+    """
+    Handle for endpoint: /api/astronauts/export
+    """
+    # Ties go to the last entry, so NDJSON is the default.
+    FORMATS = OrderedDict([
+        ('csv', 'text/csv'),
+        ('ndjson', 'application/x-ndjson'),
+    ])
+    media_types = list(FORMATS.values())
+
+    def __init__(self, **kwargs):
+        """ Creates a client instance """
+        super(Export, self).__init__(**kwargs)
+
+    @falcon.before(validate_token)
+    def on_get(self, req, res):
+        """Streams every astronaut matching the list filters as NDJSON or CSV,
+        chosen by `?format=` or the Accept header."""
+        params = req.params
+        if params.get('id'):
+            params['id_'] = params['id']
+        check_filters(req, params)
+
+        export_format = params.get('format')
+        if export_format is None:
+            preferred = req.client_prefers(self.media_types) or self.FORMATS['ndjson']
+            export_format = next(k for k, v in self.FORMATS.items() if v == preferred)
+        elif export_format not in self.FORMATS:
+            error = {
+                'description': 'invalid format',
+                'details': {'choices': list(self.FORMATS)}
+            }
+            LOG.error(error)
+            raise generic_error_handler(400, req=req, error_override=error)
+
+        chunks = db.iter_astronaut_rows(filters=params, chunk_size=STREAM_CHUNK_SIZE)
+        res.status = falcon.HTTP_200
+        res.content_type = self.FORMATS[export_format]
+        res.stream = getattr(self, f'to_{export_format}')(chunks)
+
+    def to_ndjson(self, chunks):
+        with closing(chunks):
+            for rows in chunks:
+                yield b''.join(dumps({
+                    'id': row[0],
+                    'active': bool(row[1]),
+                    'firstName': row[2],
+                    'lastName': row[3],
+                    'skills': row[4].split(","),
+                    'hoursInSpace': row[5],
+                    'picture': row[6],
+                }) + b'\n' for row in rows)
+
+    def to_csv(self, chunks):
+        buffer = io.StringIO()
+        csv_writer = csv.writer(buffer)
+        csv_writer.writerow(['id', 'active', 'firstName', 'lastName', 'skills', 'hoursInSpace', 'picture'])
+        with closing(chunks):
+            for rows in chunks:
+                csv_writer.writerows((row[0], int(bool(row[1]))) + tuple(row[2:]) for row in rows)
+                yield buffer.getvalue().encode('utf-8')
+                buffer.seek(0)
+                buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode('utf-8')
+
+class Stats(BaseResource):
+    """
+    Handle for endpoint: /api/astronauts/stats
+    """
+    etag_table = 'astronauts'
+
+    @falcon.before(validate_token)
+    def on_get(self, req, res):
+        """Totals over every astronaut, read from the trigger-maintained
+        summary tables instead of the astronaut list."""
+        self.on_success(res, db.fetch_astronaut_stats())
+
 class Detail(BaseResource):
     """
     Handle for endpoint: /api/credentials/
     """
+    etag_table = 'astronauts'
+
     def __init__(self, **kwargs):
         """ Creates a client instance """
         super(Detail, self).__init__(**kwargs)
@@ -134,7 +460,14 @@ class Detail(BaseResource):
             payload["hoursInSpace"] = req.get_json("hoursInSpace", default=data['hoursInSpace'])
             payload["picture"] = req.get_json("picture", default=data['picture'])
 
-            astronaut = db.update_astronaut_info(id_, fields=payload)
+            try:
+                astronaut = db.update_astronaut_info(id_, fields=payload)
+            except sqlite3.IntegrityError as ex:
+                error = {
+                    'description': str(ex)
+                }
+                LOG.error(error)
+                raise generic_error_handler(400, req=req, error_override=error)
 
         else:
             error = {
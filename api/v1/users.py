@@ -11,7 +11,7 @@ from api.common import BaseResource
 from conf.config import LOG, SUPER_ADMIN_KEY
 from db_ import database as db
 from utils.errors import generic_error_handler
-from utils.hashing_tools import make_password_hashing, checking_password_hash
+from utils.hashing_tools import make_password_hashing, checking_password_hash, needs_rehash
 from utils.jwt_module import jwt_payload_handler
 
 class Users(BaseResource):
@@ -66,7 +66,6 @@ class Users(BaseResource):
         users = db.fetch_users(username)
 
         user_id = str(uuid.uuid4())
-        pasword = make_password_hashing(new_password)
 
         if len(users) == 1:
             if not checking_password_hash(password, users[0]['password']):
@@ -76,6 +75,8 @@ class Users(BaseResource):
                 LOG.error(error)
                 raise generic_error_handler(401, req=req, error_override=error)
             else:
+                # Hashed only now: a wrong password must not cost a hash.
+                pasword = make_password_hashing(new_password)
                 db.replace_user_info(user_id, username, pasword)
                 
         elif len(users) > 1:
@@ -85,6 +86,7 @@ class Users(BaseResource):
             LOG.error(error)
             raise generic_error_handler(400, req=req, error_override=error)
         else:
+            pasword = make_password_hashing(new_password)
             db.create_user(user_id, username, pasword)
         
         data = {
@@ -99,8 +101,6 @@ class Users(BaseResource):
         password = req.get_json('password', dtype=str, min=8, max=20)
         new_password = req.get_json('new_password', dtype=str, min=8, max=20)
 
-        pasword = make_password_hashing(new_password)
-        
         users = db.fetch_users(username)
 
         if len(users) == 1:
@@ -111,6 +111,7 @@ class Users(BaseResource):
                 LOG.error(error)
                 raise generic_error_handler(401, req=req, error_override=error)
             else:
+                pasword = make_password_hashing(new_password)
                 db.update_password(users[0]['id'], pasword)
                 data = {
                     'id': users[0]['id'],
@@ -216,6 +217,10 @@ class JWTLogin(BaseResource):
                 LOG.error(error)
                 raise generic_error_handler(401, req=req, error_override=error)
             else:
+                if needs_rehash(users[0]['password']):
+                    # Upgrades legacy and outdated hashes while we have the password.
+                    db.update_password(users[0]['id'], make_password_hashing(password))
+
                 payload = OrderedDict()
                 payload['id'] = users[0]['id']
                 payload['username'] = username
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""Load test of `main:application` (WSGI) against `main:asgi_application`.
+
+    python -m benchmarks.asgi_load [--connections 50,500,2000] [--duration 10]
+
+Starts each mode in its own process on a scratch database: the WSGI app on
+the standard library's threaded WSGI server (one thread per connection),
+the ASGI app on uvicorn (must be installed; it is not a dependency of the
+API). Then `--connections` clients keep requesting a single astronaut and a
+page of the list, one request per connection, for `--duration` seconds.
+Reports throughput, latency percentiles, errors and the server's peak RSS
+and thread count. The client shares the machine with the server, so run it
+with spare cores for absolute numbers.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+from benchmarks.common import percentile, report, use_database
+
+def serve(mode, port, rows):
+    """Runs in the server process."""
+    from benchmarks.common import seed_astronauts
+    import main
+
+    seed_astronauts(rows)
+    run_server(mode, port)
+
+def run_server(mode, port):
+    """Serves `main` on 127.0.0.1:port until terminated."""
+    import main
+
+    if mode == 'asgi':
+        import uvicorn
+        uvicorn.run(main.asgi_application, host='127.0.0.1', port=port, log_level='warning',
+                    access_log=False, backlog=4096)
+    else:
+        from socketserver import ThreadingMixIn
+        from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+        class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+            daemon_threads = True
+            request_queue_size = 4096
+
+        class QuietHandler(WSGIRequestHandler):
+            def log_message(self, *args):
+                pass
+
+        from utils.hashing_tools import shutdown_pool
+
+        # Exit through SystemExit on terminate so the hashing processes stop too.
+        signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+        try:
+            make_server('127.0.0.1', port, main.application, ThreadingWSGIServer, QuietHandler).serve_forever()
+        finally:
+            shutdown_pool()
+
+def server_stats(pid):
+    """Peak RSS and current thread count of the server, where /proc exists."""
+    stats = {}
+    try:
+        with open(f'/proc/{pid}/status') as status:
+            for line in status:
+                key, _, value = line.partition(':')
+                if key == 'VmHWM':
+                    stats['peak_rss_mb'] = round(int(value.split()[0]) / 1024, 1)
+                elif key == 'Threads':
+                    stats['threads'] = int(value)
+    except OSError:
+        pass
+    return stats
+
+async def fetch(port, method, path, headers, body=b''):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    try:
+        head = ''.join(f'{name}: {value}\r\n' for name, value in headers.items())
+        writer.write(f'{method} {path} HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n'
+                     f'Content-Length: {len(body)}\r\n{head}\r\n'.encode('latin-1') + body)
+        response = await reader.read()
+    finally:
+        writer.close()
+    head, _, body = response.partition(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split(' ', 2)[1])
+    response_headers = dict((name.strip().lower(), value.strip()) for name, _, value in
+                            (line.partition(':') for line in lines[1:]))
+    return status, response_headers, body
+
+async def load(port, pid, connections, duration, headers, ids):
+    deadline = time.perf_counter() + duration
+    samples, errors = [], {}
+    peak_threads = [0]
+    rnd = random.Random(0)
+
+    async def watch_threads():
+        while time.perf_counter() < deadline:
+            peak_threads[0] = max(peak_threads[0], server_stats(pid).get('threads', 0))
+            await asyncio.sleep(0.25)
+
+    async def client():
+        while time.perf_counter() < deadline:
+            path = (f'/api/astronauts/{rnd.choice(ids)}' if rnd.random() < 0.8
+                    else '/api/astronauts?limit=20')
+            started = time.perf_counter()
+            try:
+                status, _, _ = await fetch(port, 'GET', path, headers)
+            except (OSError, IndexError, asyncio.IncompleteReadError) as ex:
+                status = type(ex).__name__
+            if status == 200:
+                samples.append((time.perf_counter() - started) * 1000)
+            else:
+                errors[str(status)] = errors.get(str(status), 0) + 1
+
+    await asyncio.gather(watch_threads(), *(client() for _ in range(connections)))
+    return samples, errors, peak_threads[0]
+
+async def login(port):
+    json_headers = {'Content-Type': 'application/json'}
+    credentials = json.dumps({'username': 'bench_user', 'password': 'bench_password'}).encode('utf-8')
+    await fetch(port, 'POST', '/api/users', json_headers, credentials)
+    _, _, body = await fetch(port, 'POST', '/api/credentials', json_headers, credentials)
+    headers = {'Authorization': 'JWT ' + json.loads(body)['jwt']}
+    _, _, body = await fetch(port, 'GET', '/api/astronauts?limit=1000', headers)
+    return headers, [astronaut['id'] for astronaut in json.loads(body)['items']]
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def wait_for(port, process, timeout=120):
+    """Waits until the server accepts connections (it seeds before listening)."""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'server exited with {process.returncode}')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('server did not start')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--connections', default='50,500,2000')
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--modes', default='wsgi,asgi')
+    parser.add_argument('--serve', choices=['wsgi', 'asgi'], help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.port, args.rows)
+        return
+
+    for mode in args.modes.split(','):
+        port = free_port()
+        env = dict(os.environ, DATABASE=use_database())
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'benchmarks.asgi_load', '--serve', mode, '--port', str(port),
+             '--rows', str(args.rows)], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_for(port, process)
+            headers, ids = asyncio.run(login(port))
+            for connections in (int(c) for c in args.connections.split(',')):
+                samples, errors, peak_threads = asyncio.run(
+                    load(port, process.pid, connections, args.duration, headers, ids))
+                report(mode=mode, connections=connections, requests=len(samples),
+                       rps=round(len(samples) / args.duration),
+                       p50_ms=round(percentile(samples, 50) or 0, 2),
+                       p95_ms=round(percentile(samples, 95) or 0, 2),
+                       p99_ms=round(percentile(samples, 99) or 0, 2),
+                       errors=errors, peak_threads=peak_threads,
+                       peak_rss_mb=server_stats(process.pid).get('peak_rss_mb'))
+        finally:
+            process.terminate()
+            process.wait()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""Checks that a write in one worker process reaches the caches of the others.
+
+    python -m benchmarks.cache_coherence [--workers 4] [--bound 1.0]
+
+Starts several processes that keep reading one astronaut (by id and through
+a listing) from their in-process caches, with a TTL far too long to expire
+during the run. The parent then PATCHes that astronaut through the data
+layer and every worker must observe the new value within `--bound` seconds.
+Exits non-zero otherwise.
+"""
+import argparse
+import multiprocessing
+import sys
+import time
+
+from benchmarks.common import report, seed_astronauts, use_database
+
+CACHE_TTL = 3600
+
+def watch(path, id_, expected, deadline, ready, seen):
+    use_database(path, ASTRONAUT_CACHE_TTL=CACHE_TTL)
+    from db_ import database as db
+
+    def current():
+        by_id = db.fetch_astronauts({'id_': id_})[0]['hoursInSpace']
+        listed = [a['hoursInSpace'] for a in db.fetch_astronauts({'firstName': 'First0'})]
+        return by_id, listed
+
+    current()
+    ready.put(True)
+    while time.time() < deadline:
+        by_id, listed = current()
+        if by_id == expected and listed == [expected]:
+            seen.put((time.time(), db.cache_stats()))
+            return
+        time.sleep(0.001)
+    seen.put((None, db.cache_stats()))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--bound', type=float, default=1.0)
+    args = parser.parse_args()
+
+    path = use_database(ASTRONAUT_CACHE_TTL=CACHE_TTL)
+    from db_ import database as db, init_session
+
+    init_session()
+    seed_astronauts(100)
+    astronaut = db.fetch_astronauts({'firstName': 'First0'})[0]
+    expected = astronaut['hoursInSpace'] + 1
+
+    ctx = multiprocessing.get_context('spawn')
+    ready, seen = ctx.Queue(), ctx.Queue()
+    deadline = time.time() + 30 + args.bound
+    workers = [
+        ctx.Process(target=watch, args=(path, astronaut['id'], expected, deadline, ready, seen))
+        for _ in range(args.workers)]
+    for worker in workers:
+        worker.start()
+    for _ in workers:
+        ready.get(timeout=30)
+    # Let every worker serve a few reads from its cache first.
+    time.sleep(0.2)
+
+    written_at = time.time()
+    db.update_astronaut_info(astronaut['id'], {'hoursInSpace': expected})
+
+    failures = 0
+    for _ in workers:
+        seen_at, stats = seen.get(timeout=60)
+        lag = None if seen_at is None else round(seen_at - written_at, 4)
+        if lag is None or lag > args.bound:
+            failures += 1
+        report(lag_seconds=lag, cache_hits=stats['astronauts']['hits'] + stats['listings']['hits'])
+    for worker in workers:
+        worker.join()
+
+    report(workers=args.workers, bound_seconds=args.bound, failures=failures)
+    sys.exit(1 if failures else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""Worker cold start: time from a new interpreter to the first answered request.
+
+    python -m benchmarks.cold_start [--astronauts 100000] [--workers 4] [--rounds 3]
+
+Every start is a fresh `python -m benchmarks.cold_start --measure` importing
+`main` and calling GET / and GET /api/astronauts/stats, like a new gunicorn
+worker. Reports the best of `--rounds` for:
+
+- fresh: an empty file, migrated and seeded (`DB_SEED=empty`)
+- existing: a database already holding `--astronauts` and some users, which
+  a worker should only open, whatever its size
+- reset: the same database with `DB_SEED=reset`, i.e. dropping and
+  re-creating everything as every start used to (measured once)
+- workers: `--workers` processes starting at once on a fresh file; they
+  must agree on the schema version and seed it once
+
+`users` shows whether the accounts survived the start.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.common import report, run_child, seed_astronauts, seed_users, use_database
+
+def measure():
+    """Runs in the child process: one worker start."""
+    started = time.perf_counter()
+    import main
+    from benchmarks.common import call
+    from db_ import database as db
+
+    imported = time.perf_counter()
+    call(main.application, 'GET', '/')
+    db.fetch_astronaut_stats()
+    answered = time.perf_counter()
+    with db.readers.connection() as conn:
+        version = conn.execute("PRAGMA user_version;").fetchone()[0]
+    report(import_ms=round((imported - started) * 1000, 1), ready_ms=round((answered - started) * 1000, 1),
+           version=version, astronauts=db.fetch_astronaut_stats()['count'], users=len(db.fetch_users()))
+
+def start(path, seed):
+    """One worker start against `path`, timed from outside the interpreter."""
+    started = time.perf_counter()
+    line, = run_child('benchmarks.cold_start', '--measure', DATABASE=path, DB_SEED=seed, LOG_LEVEL='WARNING')
+    return dict(line, wall_ms=round((time.perf_counter() - started) * 1000, 1))
+
+def best(starts):
+    return min(starts, key=lambda line: line['wall_ms'])
+
+def scratch():
+    return os.path.join(tempfile.mkdtemp(prefix='dummy_api_'), 'cold.db')
+
+def concurrent(workers):
+    """Starts `workers` processes at once on a fresh file."""
+    env = dict(os.environ, DATABASE=scratch(), DB_SEED='empty', LOG_LEVEL='WARNING')
+    started = time.perf_counter()
+    children = [subprocess.Popen([sys.executable, '-m', 'benchmarks.cold_start', '--measure'],
+                                 env=env, stdout=subprocess.PIPE, universal_newlines=True)
+                for _ in range(workers)]
+    lines = []
+    for child in children:
+        out, _ = child.communicate()
+        lines += [json.loads(line) for line in out.splitlines() if line.startswith('{')]
+    wall_ms = round((time.perf_counter() - started) * 1000, 1)
+    return lines, wall_ms, sum(child.returncode != 0 for child in children)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--astronauts', type=int, default=100000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--measure', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure()
+        return
+
+    report(case='fresh', **best([start(scratch(), 'empty') for _ in range(args.rounds)]))
+
+    path = use_database(DB_SEED='never')
+    from db_ import init_session
+
+    init_session()
+    seed_astronauts(args.astronauts)
+    seed_users(args.users)
+    report(case='existing', **best([start(path, 'never') for _ in range(args.rounds)]))
+    # Once and last: it throws the seeded data away.
+    report(case='reset', **start(path, 'reset'))
+
+    lines, wall_ms, failed = concurrent(args.workers)
+    report(case='workers', workers=args.workers, failed=failed, wall_ms=wall_ms,
+           slowest_ready_ms=max((line['ready_ms'] for line in lines), default=None),
+           versions=sorted({line['version'] for line in lines}),
+           astronauts=sorted({line['astronauts'] for line in lines}))
+
+if __name__ == '__main__':
+    main()
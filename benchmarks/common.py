@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""Helpers shared by the benchmark scripts.
+
+The scripts are run from the repository root, e.g.
+`python -m benchmarks.wal_readers`. Each one works on a scratch database so
+`db_/data.db` is never touched; call `use_database()` before anything from
+`db_` or `main` is imported because the configuration is read at import time.
+"""
+import json
+import os
+import random
+import sys
+import tempfile
+import uuid
+
+def use_database(path=None, **env):
+    """Points the app at a scratch database and extra config overrides."""
+    if path is None:
+        path = os.path.join(tempfile.mkdtemp(prefix='dummy_api_'), 'bench.db')
+    os.environ['DATABASE'] = path
+    # Scratch databases start with the dummy astronauts, like data.db used to.
+    env.setdefault('DB_SEED', 'empty')
+    for key, value in env.items():
+        os.environ[key] = str(value)
+    return path
+
+def make_astronauts(count, seed=0):
+    from db_.dummy import ASTRONAUTS
+
+    skills = sorted({skill for astronaut in ASTRONAUTS for skill in astronaut['skills']})
+    rnd = random.Random(seed)
+    for i in range(count):
+        yield {
+            'id': str(uuid.UUID(int=rnd.getrandbits(128), version=4)),
+            'active': rnd.random() < 0.5,
+            'firstName': f'First{i}',
+            'lastName': f'Last{i}',
+            'skills': rnd.sample(skills, rnd.randint(1, 3)),
+            'hoursInSpace': rnd.randint(0, 2000),
+            'picture': f'astronaut-{i}.jpg',
+        }
+
+def seed_astronauts(count, chunk_size=10000, seed=0):
+    from db_ import database as db
+
+    chunk = []
+    for astronaut in make_astronauts(count, seed=seed):
+        chunk.append(astronaut)
+        if len(chunk) == chunk_size:
+            db.insert_astronauts_batch(chunk)
+            chunk = []
+    if chunk:
+        db.insert_astronauts_batch(chunk)
+
+def seed_users(count, password='bench_password', chunk_size=10000):
+    """Creates users `user0`..`user<count-1>`, all with `password`. The hash is
+    computed once and shared, so seeding does not pay for `count` hashes."""
+    from db_ import database as db
+    from utils.hashing_tools import make_password_hashing
+
+    hashed = make_password_hashing(password)
+    rows = ((str(uuid.UUID(int=i, version=4)), f'user{i}', hashed) for i in range(count))
+    while True:
+        chunk = [row for _, row in zip(range(chunk_size), rows)]
+        if not chunk:
+            break
+        with db.writer.connection() as conn:
+            conn.executemany("INSERT INTO users(id_, username, password) VALUES(?, ?, ?)", chunk)
+    db.generations.bump('users')
+
+def peak_rss_mb():
+    """Peak resident set size of this process, where the platform reports it."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes.
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+def percentile(samples, pct):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+def report(**fields):
+    print(json.dumps(fields), flush=True)
+
+def run_child(module, *args, **env):
+    """Runs `python -m module args` in a fresh interpreter and returns its
+    JSON lines, so configuration read at import time can differ per run."""
+    import subprocess
+
+    child_env = dict(os.environ, **{key: str(value) for key, value in env.items()})
+    out = subprocess.run(
+        [sys.executable, '-m', module] + [str(arg) for arg in args],
+        env=child_env, check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+    return [json.loads(line) for line in out.splitlines() if line.startswith('{')]
+
+def call(app, method, path, headers=None, body=None, query_string=''):
+    """Calls a WSGI app in-process and returns (status, headers, body)."""
+    from falcon import testing
+
+    if body is not None and not isinstance(body, bytes):
+        body = json.dumps(body).encode('utf-8')
+    env = testing.create_environ(
+        path=path, query_string=query_string, method=method, headers=headers, body=body or b'')
+    result = {}
+
+    def start_response(status, response_headers, exc_info=None):
+        result['status'] = status
+        result['headers'] = dict(response_headers)
+
+    chunks = app(env, start_response)
+    try:
+        payload = b''.join(chunks)
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+    return result['status'], result['headers'], payload
+
+def login(app, username='bench_user', password='bench_password'):
+    """Creates a user and returns headers carrying its JWT."""
+    json_headers = {'Content-Type': 'application/json'}
+    credentials = {'username': username, 'password': password}
+    call(app, 'POST', '/api/users', json_headers, credentials)
+    status, _, payload = call(app, 'POST', '/api/credentials', json_headers, credentials)
+    return {'Authorization': 'JWT ' + json.loads(payload)['jwt']}
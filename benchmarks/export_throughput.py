@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""Rows/second of `GET /api/astronauts/export` as NDJSON and CSV.
+
+    python -m benchmarks.export_throughput [--rows 1000000]
+
+Seeds a scratch database, then drains the export stream in-process for each
+format and reports throughput, bytes written and peak RSS (which should not
+grow with `--rows`).
+"""
+import argparse
+import time
+
+from benchmarks.common import login, peak_rss_mb, report, seed_astronauts, use_database
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    args = parser.parse_args()
+
+    use_database()
+    import main
+    from falcon import testing
+
+    started = time.perf_counter()
+    seed_astronauts(args.rows)
+    report(seeded=args.rows, seconds=round(time.perf_counter() - started, 2), peak_rss_mb=peak_rss_mb())
+    headers = login(main.application)
+
+    for export_format in ('ndjson', 'csv'):
+        env = testing.create_environ(
+            path='/api/astronauts/export', query_string=f'format={export_format}', headers=headers)
+        started = time.perf_counter()
+        written = 0
+        body = main.application(env, lambda status, headers, exc_info=None: None)
+        for chunk in body:
+            written += len(chunk)
+        seconds = time.perf_counter() - started
+        report(format=export_format, rows=args.rows, seconds=round(seconds, 2),
+               rows_per_sec=round(args.rows / seconds), mb_written=round(written / 1e6, 1),
+               peak_rss_mb=peak_rss_mb())
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""Write throughput of concurrent PATCH requests with and without group commit.
+
+    python -m benchmarks.group_commit [--threads 32] [--seconds 5] [--rows 10000]
+
+Each setting runs in a fresh interpreter: `--threads` threads PATCH
+astronauts through the WSGI app for `--seconds`, every thread its own rows,
+once with every write committing on its own (`DB_GROUP_COMMIT_SIZE=0`) and
+with the write queue at several `DB_GROUP_COMMIT_WINDOW`s, for both
+`DB_SYNCHRONOUS=NORMAL` (WAL only syncs on checkpoints, the default
+without the queue) and `FULL` (one fsync per commit, the default with it).
+Reports PATCHes/sec, latency, writes per transaction and `lost`:
+acknowledged values that are not in the database afterwards.
+"""
+import argparse
+import random
+import threading
+import time
+
+from benchmarks.common import call, login, percentile, report, run_child, seed_astronauts, use_database
+
+SETTINGS = [
+    ('per request', {'DB_GROUP_COMMIT_SIZE': 0}),
+    ('queue, no wait', {'DB_GROUP_COMMIT_WINDOW': 0}),
+    ('queue, 2 ms', {'DB_GROUP_COMMIT_WINDOW': 0.002}),
+    ('queue, 5 ms', {'DB_GROUP_COMMIT_WINDOW': 0.005}),
+]
+
+def measure(args):
+    """Runs in the child process, prints one line."""
+    use_database()
+    import main
+    from db_ import database as db
+
+    seed_astronauts(args.rows)
+    headers = dict(login(main.application), **{'Content-Type': 'application/json'})
+    ids = [astronaut['id'] for astronaut in db.fetch_astronauts(limit=args.rows)]
+    stop = threading.Event()
+    latencies = [[] for _ in range(args.threads)]
+    acknowledged = [{} for _ in range(args.threads)]
+    errors = [0]
+
+    def worker(n):
+        rnd = random.Random(n)
+        mine = ids[n::args.threads]
+        value = 0
+        while not stop.is_set():
+            id_, value = rnd.choice(mine), value + 1
+            started = time.perf_counter()
+            status, _, _ = call(main.application, 'PATCH', f'/api/astronauts/{id_}', headers,
+                                {'hoursInSpace': value})
+            latencies[n].append(time.perf_counter() - started)
+            if status.startswith('200'):
+                acknowledged[n][id_] = value
+            else:
+                errors[0] += 1
+
+    threads = [threading.Thread(target=worker, args=(n, )) for n in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    # Straight from a new connection, past every cache.
+    stored = dict(db.create_connection(db.DATABASE).execute("SELECT id_, hoursInSpace FROM astronauts;"))
+    lost = sum(stored[id_] != value for values in acknowledged for id_, value in values.items())
+    samples = [latency for thread in latencies for latency in thread]
+    writes = db.writes.stats()
+    report(patches_per_sec=round(len(samples) / args.seconds),
+           p50_ms=round(percentile(samples, 50) * 1000, 2), p99_ms=round(percentile(samples, 99) * 1000, 2),
+           writes_per_transaction=round(writes['writes'] / writes['transactions'], 1) if writes['transactions'] else 1,
+           errors=errors[0], lost=lost)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--measure', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(args)
+        return
+
+    for synchronous in ('NORMAL', 'FULL'):
+        for name, env in SETTINGS:
+            line, = run_child('benchmarks.group_commit', '--measure', '--threads', args.threads,
+                              '--seconds', args.seconds, '--rows', args.rows,
+                              DB_SYNCHRONOUS=synchronous, LOG_LEVEL='WARNING', **env)
+            report(synchronous=synchronous, setting=name, **line)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""Fetching many astronauts by id: one request per id against one lookup.
+
+    python -m benchmarks.id_lookup [--rows 10000] [--ids 10,100,1000] [--repeat 20]
+
+Calls the WSGI app in-process for `--ids` random seeded ids at a time as
+GET /api/astronauts/{id_} per id, GET /api/astronauts?ids=... and
+POST /api/astronauts/lookup. `cold` clears the astronaut cache before every
+round, `warm` reads what the previous round cached. Reports the best time
+per round.
+"""
+import argparse
+import random
+import time
+
+from benchmarks.common import call, login, report, seed_astronauts, use_database
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--ids', default='10,100,1000')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    use_database(LOG_LEVEL='WARNING', ASTRONAUT_CACHE_SIZE=args.rows)
+    import main
+    from db_ import database as db
+
+    seed_astronauts(args.rows)
+    headers = login(main.application)
+    json_headers = dict(headers, **{'Content-Type': 'application/json'})
+    ids = [astronaut['id'] for astronaut in db.fetch_astronauts(limit=args.rows)]
+    rnd = random.Random(0)
+
+    ways = [
+        ('GET /{id_} per id', lambda sample: [
+            call(main.application, 'GET', f'/api/astronauts/{id_}', headers) for id_ in sample]),
+        ('GET ?ids', lambda sample: call(
+            main.application, 'GET', '/api/astronauts', headers, query_string=f"ids={','.join(sample)}")),
+        ('POST /lookup', lambda sample: call(
+            main.application, 'POST', '/api/astronauts/lookup', json_headers, {'ids': sample})),
+    ]
+    for count in (int(n) for n in args.ids.split(',')):
+        sample = rnd.sample(ids, count)
+        for cache in ('cold', 'warm'):
+            for name, fetch in ways:
+                best = None
+                for _ in range(args.repeat):
+                    if cache == 'cold':
+                        db.astronaut_cache.clear()
+                    started = time.perf_counter()
+                    fetch(sample)
+                    elapsed = time.perf_counter() - started
+                    best = elapsed if best is None else min(best, elapsed)
+                report(ids=count, cache=cache, way=name, ms=round(best * 1000, 2))
+
+if __name__ == '__main__':
+    main()
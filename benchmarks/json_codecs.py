@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""Encode/decode cost of the available JSON codecs on astronaut payloads.
+
+    python -m benchmarks.json_codecs [--items 100] [--repeat 200]
+
+Compares the old stdlib path (`json.dumps` with a JSONEncoder subclass)
+against every codec `utils.json_codec` can pick, on a list envelope like the
+one `GET /api/astronauts` returns and on a single astronaut.
+"""
+import argparse
+import datetime
+import importlib
+import json
+import os
+import timeit
+
+from benchmarks.common import make_astronauts, report
+
+class DateTimeEncoder(json.JSONEncoder):
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return json.JSONEncoder.default(self, o)
+
+def codecs():
+    yield 'json+JSONEncoder', (
+        lambda obj: str.encode(json.dumps(obj, cls=DateTimeEncoder)),
+        lambda raw: json.loads(raw.decode('utf-8')))
+    import utils.json_codec as codec
+    for name in ('json', 'orjson'):
+        os.environ['JSON_CODEC'] = name
+        try:
+            import conf.config
+            importlib.reload(conf.config)
+            importlib.reload(codec)
+        except ImportError:
+            continue
+        yield codec.CODEC, (codec.dumps, codec.loads)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--items', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    astronauts = list(make_astronauts(args.items))
+    meta = {'code': 200, 'message': 'OK', 'generated_at': datetime.datetime.utcnow()}
+    payloads = {
+        'list': {'count': len(astronauts), 'items': astronauts, 'next': None, 'meta': meta},
+        'detail': dict(astronauts[0], meta=meta),
+    }
+
+    for name, (dumps, loads) in codecs():
+        for payload_name, payload in payloads.items():
+            raw = dumps(payload)
+            encode = min(timeit.repeat(lambda: dumps(payload), number=args.repeat, repeat=3))
+            decode = min(timeit.repeat(lambda: loads(raw), number=args.repeat, repeat=3))
+            report(codec=name, payload=payload_name, items=args.items, bytes=len(raw),
+                   encode_us=round(encode / args.repeat * 1e6, 2),
+                   decode_us=round(decode / args.repeat * 1e6, 2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""Checks that concurrent requests never read each other's JSON body.
+
+    python -m benchmarks.json_isolation [--threads 32] [--requests 200]
+
+Calls the WSGI app from `--threads` threads at once, the way gthread or
+waitress workers do, with the interpreter switching threads as often as it
+can. Every thread POSTs astronauts and then PATCHes them with payloads only
+it sends (names carry the thread and request number) and compares each
+response with its own payload. Reports the number of checks, mismatches and
+throughput; exits non-zero on any mismatch or unexpected status.
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+
+from benchmarks.common import call, login, report, use_database
+
+def payload(worker, i):
+    return {
+        'firstName': f'T{worker}n{i}',
+        'lastName': f'L{worker}n{i}',
+        'skills': [f'skill-{worker}', f'request-{i}'],
+        'hoursInSpace': worker * 100000 + i,
+        'picture': f'thread-{worker}-{i}.jpg',
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+
+    use_database()
+    import main
+
+    headers = dict(login(main.application), **{'Content-Type': 'application/json'})
+    checks, mismatches = [0], []
+    lock = threading.Lock()
+    start = threading.Barrier(args.threads)
+
+    def check(worker, i, method, status, body, sent):
+        data = json.loads(body) if body else {}
+        # POST wraps the astronaut in 'data', PATCH answers with it directly.
+        data = data.get('data', data)
+        wrong = {field: data.get(field) for field, value in sent.items() if data.get(field) != value}
+        with lock:
+            checks[0] += 1
+            if not status.startswith(('200', '201')) or wrong:
+                mismatches.append({'thread': worker, 'request': i, 'method': method,
+                                   'status': status, 'wrong': wrong})
+        return data
+
+    def worker(n):
+        start.wait()
+        for i in range(args.requests):
+            sent = payload(n, i)
+            status, _, body = call(main.application, 'POST', '/api/astronauts', headers, sent)
+            created = check(n, i, 'POST', status, body, sent)
+            if 'id' not in created:
+                continue
+            # A partial PATCH: the other fields must come back from the row, not another body.
+            sent = {'lastName': f'P{n}n{i}', 'hoursInSpace': sent['hoursInSpace'] + 1}
+            status, _, body = call(main.application, 'PATCH', f"/api/astronauts/{created['id']}",
+                                   headers, sent)
+            check(n, i, 'PATCH', status, body, dict(sent, firstName=f'T{n}n{i}'))
+
+    sys.setswitchinterval(1e-6)
+    threads = [threading.Thread(target=worker, args=(n, )) for n in range(args.threads)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    report(threads=args.threads, checks=checks[0], mismatches=len(mismatches),
+           rps=round(checks[0] / elapsed), examples=mismatches[:5])
+    if mismatches:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""Latency of a protected endpoint with the verified-JWT cache on and off.
+
+    python -m benchmarks.jwt_cache [--requests 5000]
+
+Calls `GET /api/astronauts/{id_}` in-process with the same token over and
+over; the astronaut itself is served from the lookup cache, so the
+difference between runs is the token verification.
+"""
+import argparse
+import time
+
+from benchmarks.common import call, login, percentile, report, run_child, use_database
+
+def measure(args):
+    use_database()
+    import main
+    from db_ import database as db
+    from middleware.jwt_authentication import verified_tokens
+
+    headers = login(main.application)
+    path = f"/api/astronauts/{db.fetch_astronauts()[0]['id']}"
+
+    samples = []
+    for _ in range(args.requests):
+        started = time.perf_counter()
+        call(main.application, 'GET', path, headers)
+        samples.append(time.perf_counter() - started)
+
+    report(jwt_cache_size=verified_tokens.maxsize, requests=args.requests,
+           p50_us=round(percentile(samples, 50) * 1e6, 1),
+           p99_us=round(percentile(samples, 99) * 1e6, 1),
+           cache=verified_tokens.stats())
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--child', action='store_true')
+    args = parser.parse_args()
+
+    if args.child:
+        measure(args)
+        return
+
+    for size in (0, 4096):
+        for line in run_child('benchmarks.jwt_cache', '--child', '--requests', args.requests,
+                              JWT_CACHE_SIZE=size):
+            report(**line)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""Logins per second (and per core) for the password hashing settings.
+
+    python -m benchmarks.login_throughput [--clients 8] [--seconds 5]
+
+A burst of clients keeps posting to `/api/credentials` in-process. Runs once
+hashing on the request threads (PASSWORD_HASH_WORKERS=0) and once with the
+process pool, each in a fresh interpreter.
+"""
+import argparse
+import os
+import threading
+import time
+
+from benchmarks.common import call, login, report, run_child, use_database
+
+def measure(args):
+    use_database()
+    import main
+    from conf.config import PASSWORD_HASH_ALGORITHM, PASSWORD_HASH_COST, PASSWORD_HASH_WORKERS
+
+    login(main.application, 'storm_user', 'storm_password')
+    credentials = {'username': 'storm_user', 'password': 'storm_password'}
+    headers = {'Content-Type': 'application/json'}
+
+    stop = threading.Event()
+    logins = [0] * args.clients
+
+    def client(slot):
+        while not stop.is_set():
+            status, _, _ = call(main.application, 'POST', '/api/credentials', headers, credentials)
+            if status.startswith('200'):
+                logins[slot] += 1
+
+    threads = [threading.Thread(target=client, args=(slot, )) for slot in range(args.clients)]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    cores = PASSWORD_HASH_WORKERS or os.cpu_count() or 1
+    per_second = sum(logins) / args.seconds
+    report(algorithm=PASSWORD_HASH_ALGORITHM, cost=PASSWORD_HASH_COST, workers=PASSWORD_HASH_WORKERS,
+           clients=args.clients, logins_per_sec=round(per_second, 1),
+           logins_per_sec_per_core=round(per_second / cores, 1))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--child', action='store_true')
+    args = parser.parse_args()
+
+    if args.child:
+        measure(args)
+        return
+
+    for workers in (0, os.cpu_count() or 1):
+        for line in run_child('benchmarks.login_throughput', '--child', '--clients', args.clients,
+                              '--seconds', args.seconds, PASSWORD_HASH_WORKERS=workers):
+            report(**line)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""Cost of the request metrics (`RequestMetrics`, /metrics, data layer timers).
+
+    python -m benchmarks.metrics_overhead [--batches 30] [--batch-size 500] [--rounds 3]
+
+Times the recording primitives on their own, then runs the same in-process
+requests with `METRICS_ENABLED=true` and `false`, each in a fresh
+interpreter, alternating for `--rounds`, and reports the difference per
+request. A route's time is the best mean over all batches of a mode, which
+keeps scheduler noise out of a difference of a few microseconds. Also reports how long rendering /metrics
+takes once every route has been recorded.
+"""
+import argparse
+import time
+
+from benchmarks.common import call, login, report, run_child, seed_astronauts, use_database
+
+def best_mean_us(fn, batches, batch_size):
+    best = None
+    for _ in range(batches):
+        started = time.perf_counter()
+        for _ in range(batch_size):
+            fn()
+        mean = (time.perf_counter() - started) / batch_size * 1e6
+        best = mean if best is None else min(best, mean)
+    return round(best, 2)
+
+def primitives(batches, batch_size):
+    from utils.metrics import DB, Metrics, Timer
+
+    metrics = Metrics()
+    key = ('http_request_duration_seconds', 'GET', '/api/astronauts/{id_}', '200')
+
+    def timer():
+        with Timer(metrics, key, phase=DB):
+            pass
+
+    metrics.start_request()
+    report(primitive='observe', us=best_mean_us(lambda: metrics.observe(key, 0.0012), batches, batch_size * 10))
+    report(primitive='accumulate', us=best_mean_us(
+        lambda: metrics.accumulate(('http_request_phase_seconds', '/'), (1e-5, 0.0, 0.0, 1e-6, 2e-5)),
+        batches, batch_size * 10))
+    report(primitive='add_phase', us=best_mean_us(lambda: metrics.add_phase(DB, 0.0012), batches, batch_size * 10))
+    report(primitive='Timer', us=best_mean_us(timer, batches, batch_size * 10))
+
+def measure(batches, batch_size):
+    """Runs in the child process, prints one line per route."""
+    use_database()
+    import main
+    from db_ import database as db
+
+    seed_astronauts(1000)
+    headers = login(main.application)
+    astronaut = db.fetch_astronauts(limit=1)[0]['id']
+    routes = [
+        ('GET /', '/', {}, ''),
+        ('GET /api/astronauts/{id_}', f'/api/astronauts/{astronaut}', headers, ''),
+        ('GET /api/astronauts?limit=20', '/api/astronauts', headers, 'limit=20'),
+        ('GET /api/astronauts/stats', '/api/astronauts/stats', headers, ''),
+    ]
+    for name, path, route_headers, query_string in routes:
+        report(route=name, us=best_mean_us(
+            lambda: call(main.application, 'GET', path, route_headers, query_string=query_string),
+            batches, batch_size))
+    if main.METRICS_ENABLED:
+        report(route='GET /metrics', us=best_mean_us(
+            lambda: call(main.application, 'GET', '/metrics'), batches, max(1, batch_size // 10)))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--batches', type=int, default=30)
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--measure', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(args.batches, args.batch_size)
+        return
+
+    primitives(args.batches, args.batch_size)
+    runs = {'false': {}, 'true': {}}
+    # Alternating rounds, best of each, so drift of the machine affects both.
+    for _ in range(args.rounds):
+        for enabled, best in runs.items():
+            lines = run_child('benchmarks.metrics_overhead', '--measure', '--batches', args.batches,
+                              '--batch-size', args.batch_size, METRICS_ENABLED=enabled, LOG_LEVEL='WARNING')
+            for line in lines:
+                best[line['route']] = min(line['us'], best.get(line['route'], line['us']))
+    for route, us in runs['true'].items():
+        without = runs['false'].get(route)
+        report(route=route, metrics_us=us, without_us=without,
+               overhead_us=round(us - without, 2) if without is not None else None)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""Fails when a statement issued by the data layer does a full table scan.
+
+    python -m benchmarks.query_plans [--rows 10000] [--users 1000]
+
+Seeds a scratch database, exercises every data-access function with every
+filter combination `build_filters` accepts, then runs EXPLAIN QUERY PLAN on
+each statement that was issued. Unfiltered listings are expected to scan and
+are skipped, as are full-text searches answered by the FTS5 index and pages
+read in index order. Exits non-zero when any other plan contains a SCAN step,
+or when a page filtered by equalities only (not a ranked search) sorts the
+matching rows in a temporary B-tree instead of reading them in index order;
+with a range filter the planner may rightly prefer the range's index.
+"""
+import argparse
+import itertools
+import sys
+import uuid
+
+from benchmarks.common import report, seed_astronauts, use_database
+
+FILTERS = {'id_': 'missing', 'active': 'true', 'firstName': 'First1', 'lastName': 'Last1',
+           'skill': ['Physics', 'Fighter Pilot'], 'hoursInSpace[gte]': 500}
+
+def exercise(db, users):
+    for user in range(users):
+        db.create_user(str(uuid.uuid4()), f'user{user}', 'hash,salt')
+    db.fetch_users()
+    db.fetch_users('user1')
+    db.fetch_users(user_id='missing')
+    db.fetch_users('user1', user_id='missing')
+    db.update_password('missing', 'hash,salt')
+    db.replace_user_info(str(uuid.uuid4()), 'user2', 'hash,salt')
+    db.delete_from_table('users', 'missing')
+
+    for size in range(len(FILTERS) + 1):
+        for keys in itertools.combinations(FILTERS, size):
+            db.fetch_astronauts({key: FILTERS[key] for key in keys})
+    db.search_astronauts('First1')
+    db.search_astronauts('First1 Last', {'active': 'true'})
+    for sort in ('id_', '-id_', 'hoursInSpace', '-hoursInSpace'):
+        after = ('missing', ) if sort.lstrip('-') == 'id_' else (500, 'missing')
+        for filters in ({}, {'active': 'true'}, {'hoursInSpace[lt]': 1000},
+                        {'active': 'true', 'hoursInSpace[gt]': 500}):
+            db.fetch_astronauts(filters, limit=10, sort=sort)
+            db.fetch_astronauts(filters, limit=10, after=after, sort=sort)
+    db.fetch_astronauts({'skill': 'Physics'})
+    db.fetch_astronauts({'skill': ['Physics', 'Fighter Pilot'], 'skill_match': 'any'})
+    astronaut = db.fetch_astronauts()[0]
+    db.update_astronaut_info(astronaut['id'], {'hoursInSpace': 1})
+    db.update_astronaut_info(astronaut['id'], dict(astronaut, id=None))
+    db.delete_from_table('astronauts', 'missing')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--users', type=int, default=1000)
+    args = parser.parse_args()
+
+    use_database()
+    from db_ import database as db, init_session
+
+    init_session()
+    seed_astronauts(args.rows)
+    exercise(db, args.users)
+
+    failures = 0
+    for query, plan in sorted(db.explain_query_plans().items()):
+        # FTS5 lookups show up as a SCAN of the virtual table with the MATCH
+        # constraint in the index string (e.g. `VIRTUAL TABLE INDEX 0:M2`), and
+        # a page may walk an index in its ORDER BY order until LIMIT is reached.
+        scans = [step for step in plan if step.startswith('SCAN') and ':M' not in step
+                 and not (' USING INDEX ' in step and query.endswith(' LIMIT ?;'))]
+        # Keyset pages must stop after LIMIT rows, not sort all of them first.
+        sorts = (query.endswith(' LIMIT ?;') and ' MATCH ' not in query and 'USE TEMP B-TREE FOR ORDER BY' in plan
+                 and not any('>' in step or '<' in step for step in plan))
+        if (scans and ' WHERE ' in query) or sorts:
+            failures += 1
+        report(query=query, plan=plan, full_scan=bool(scans), sorted=sorts, expected=' WHERE ' not in query)
+
+    report(statements=len(db.statements.statements()), failures=failures)
+    sys.exit(1 if failures else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""Latency of `GET /api/astronauts?q=` name search against a LIKE scan.
+
+    python -m benchmarks.search_latency [--rows 1000000] [--iterations 50]
+
+Seeds a scratch database and times `search_astronauts` for prefixes of
+decreasing selectivity (seeded names are `First<n> Last<n>`, so
+`First123456` matches one astronaut and `Fi` matches all of them), with the
+listing cache cleared before every call. Every seeded name is a distinct
+token, so short prefixes expand to far more terms than real names would; that
+is the worst case for the prefix index. The same searches are timed as a
+`LIKE 'prefix%'` query over both names with the same ordering and limit,
+which is what they cost without the FTS5 index, and one search is timed
+through the whole WSGI stack.
+"""
+import argparse
+import time
+
+from benchmarks.common import call, login, peak_rss_mb, percentile, report, seed_astronauts, use_database
+
+QUERIES = ['First123456', 'First1234', 'First12', 'First1', 'Fi', 'First99 Last99']
+
+def timed(fn, iterations):
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return {pct: round(percentile(samples, int(pct[1:])), 3) for pct in ('p50', 'p95', 'p99')}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--limit', type=int, default=10)
+    args = parser.parse_args()
+
+    use_database()
+    import main
+    from db_ import database as db
+
+    started = time.perf_counter()
+    seed_astronauts(args.rows)
+    report(seeded=args.rows, seconds=round(time.perf_counter() - started, 2), peak_rss_mb=peak_rss_mb())
+
+    def like_scan(text):
+        words = text.split()
+        conditions = ' AND '.join('(firstName LIKE ? OR lastName LIKE ?)' for _ in words)
+        query = (f"SELECT {', '.join(db.ASTRONAUT_COLUMNS)} FROM astronauts WHERE {conditions} "
+                 "ORDER BY lastName, firstName LIMIT ?;")
+        params = tuple(word + '%' for word in words for _ in range(2)) + (args.limit, )
+        with db.readers.connection() as conn:
+            conn.execute(query, params).fetchall()
+
+    def search(text):
+        db.listing_cache.clear()
+        return db.search_astronauts(text, limit=args.limit)
+
+    for text in QUERIES:
+        with db.readers.connection() as conn:
+            matches = conn.execute("SELECT COUNT(*) FROM astronauts_fts WHERE astronauts_fts MATCH ?;",
+                                   (db.match_expression(text), )).fetchone()[0]
+        report(q=text, matches=matches, fts_ms=timed(lambda: search(text), args.iterations),
+               like_ms=timed(lambda: like_scan(text), args.iterations))
+
+    headers = login(main.application)
+
+    def request():
+        db.listing_cache.clear()
+        call(main.application, 'GET', '/api/astronauts', headers, query_string=f'q=First12&limit={args.limit}')
+
+    report(route='GET /api/astronauts?q=First12', ms=timed(request, args.iterations), peak_rss_mb=peak_rss_mb())
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""Checks the totals behind `GET /api/astronauts/stats` against a recount.
+
+    python -m benchmarks.stats_consistency [--rows 10000] [--ops 2000] [--seed 0]
+
+Seeds a scratch database, then runs a random mix of every astronaut write
+path (batch imports with duplicate rows, single inserts, PATCHes of active,
+hoursInSpace and skills, deletes) and compares the trigger-maintained
+summary tables with a full recomputation after each one. Also reports how
+long the endpoint takes compared to the recount. Exits non-zero on the first
+mismatch.
+"""
+import argparse
+import random
+import sys
+import time
+
+from benchmarks.common import call, login, make_astronauts, percentile, report, seed_astronauts, use_database
+
+def timed(fn, iterations=50):
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return round(percentile(samples, 50), 3)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--ops', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    use_database()
+    import main
+    from db_ import database as db
+
+    seed_astronauts(args.rows, seed=args.seed)
+    rnd = random.Random(args.seed)
+    fresh = (dict(astronaut, firstName=f"Fresh{i}") for i, astronaut in
+             enumerate(make_astronauts(args.ops * 6, seed=args.seed + 1)))
+    ids = [astronaut['id'] for astronaut in db.fetch_astronauts()]
+    skills = sorted(db.fetch_astronaut_stats()['skills'])
+
+    for op in range(args.ops):
+        kind = rnd.choice(['batch', 'insert', 'patch', 'delete'])
+        if kind == 'batch':
+            rows = [next(fresh) for _ in range(rnd.randint(1, 5))]
+            # Re-sending existing ids exercises the row-by-row fallback.
+            rows += [dict(rows[0])] if rnd.random() < 0.5 else []
+            failed = {position for position, _ in db.insert_astronauts_batch(rows)}
+            ids += [row['id'] for position, row in enumerate(rows) if position not in failed]
+        elif kind == 'insert':
+            row = next(fresh)
+            db.add_astronauts_bulk([row])
+            ids.append(row['id'])
+        elif kind == 'patch' and ids:
+            fields = rnd.choice([
+                {'active': rnd.random() < 0.5},
+                {'hoursInSpace': rnd.randint(0, 2000)},
+                {'skills': rnd.sample(skills, rnd.randint(1, 3))},
+                {'active': True, 'hoursInSpace': rnd.randint(0, 2000), 'firstName': f'Patched{op}'},
+            ])
+            db.update_astronaut_info(rnd.choice(ids), fields)
+        elif kind == 'delete' and ids:
+            db.delete_from_table('astronauts', ids.pop(rnd.randrange(len(ids))))
+
+        maintained, recomputed = db.check_astronaut_stats()
+        if maintained != recomputed:
+            report(op=op, kind=kind, maintained=maintained, recomputed=recomputed)
+            sys.exit(1)
+
+    headers = login(main.application)
+
+    def endpoint():
+        db.listing_cache.clear()
+        call(main.application, 'GET', '/api/astronauts/stats', headers)
+
+    def recount():
+        with db.readers.connection() as conn:
+            db.compute_astronaut_stats(conn.cursor())
+
+    report(ops=args.ops, consistent=True, astronauts=db.fetch_astronaut_stats()['count'],
+           endpoint_p50_ms=timed(endpoint), recount_p50_ms=timed(recount))
+
+if __name__ == '__main__':
+    main()
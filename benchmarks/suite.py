@@ -0,0 +1,403 @@
+# -*- coding: utf-8 -*-
+"""Load test of every route of `main.App`, in-process and over HTTP.
+
+    python -m benchmarks.suite [--astronauts 1k] [--users 10k] [--modes inprocess,server]
+        [--scenarios routes,login_storm,list_polling,mixed] [--clients 16] [--duration 10]
+        [--output results.json] [--compare previous.json]
+
+Seeds a scratch database with `--astronauts` (e.g. 1k, 100k, 1m) and
+`--users` (all sharing one password hash), then runs each scenario for
+`--duration` seconds with `--clients` concurrent clients:
+
+- routes: every route and method the API implements, in a create/read/
+  update/delete cycle (fails if a route of `App` has no step here)
+- login_storm: POST /api/credentials for random seeded users
+- list_polling: pages through GET /api/astronauts and polls the stats, with
+  the ETag of the previous response in If-None-Match
+- mixed: 80% GET and 20% PATCH of random astronauts
+
+`inprocess` calls the WSGI app from threads; `server` starts it in another
+process (`--server wsgi` threaded wsgiref, or `asgi` on uvicorn) seeded the
+same way and connects over TCP, one request per connection. Each scenario
+reports p50/p95/p99 latency, throughput and errors per route plus a total
+with peak RSS (of this process in-process, of the server otherwise). The
+JSON lines, or the `--output` document with the commit they were measured
+on, can be compared with a previous run using `--compare`.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from urllib.parse import quote
+
+from benchmarks.common import (call, login, make_astronauts, peak_rss_mb, percentile, report, seed_astronauts,
+                               seed_users, use_database)
+
+PASSWORD = 'bench_password'
+NEW_PASSWORD = 'bench_password2'
+JSON = {'Content-Type': 'application/json'}
+SUPER = {'SUPER-ADMIN-KEY': os.environ.get('SUPER_ADMIN_KEY', 'SUPER')}
+# Seeded ids sampled for reads and PATCHes.
+ID_SAMPLE = 10000
+
+def count(text):
+    """ '1k' -> 1000, '1m' -> 1000000 """
+    text = str(text).strip().lower()
+    scale = {'k': 1000, 'm': 1000 * 1000}.get(text[-1:], 1)
+    return int(float(text.rstrip('km')) * scale)
+
+class Context(object):
+    """What the clients know about the seeded data, rebuilt without
+    touching the database (seeding is deterministic)."""
+    def __init__(self, astronauts, users, auth, metrics):
+        from db_.dummy import ASTRONAUTS
+
+        step = max(1, astronauts // ID_SAMPLE)
+        self.ids = [a['id'] for i, a in enumerate(make_astronauts(astronauts)) if i % step == 0]
+        self.users = users
+        self.auth = auth
+        self.skills = sorted({skill for astronaut in ASTRONAUTS for skill in astronaut['skills']})
+        self.metrics = metrics
+
+def data_of(body):
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return {}
+    return payload.get('data', payload) if isinstance(payload, dict) else {}
+
+def new_astronaut(tag, rnd, skills):
+    return {'firstName': f'Bench{tag}', 'lastName': f'Suite{tag}', 'skills': rnd.sample(skills, 2),
+            'hoursInSpace': rnd.randint(0, 2000), 'picture': f'bench-{tag}.jpg'}
+
+# A scenario is a generator per client: it yields
+# (label, method, path, query string, headers, body) and is sent back the
+# (status, headers, body) of the response.
+
+def every_route(ctx, rnd, client):
+    auth, auth_json = ctx.auth, dict(ctx.auth, **JSON)
+    for n in range(sys.maxsize):
+        tag = f'{client}n{n}'
+        yield 'GET /', 'GET', '/', '', {}, None
+
+        username = f'u{tag}'[:20]
+        credentials = {'username': username, 'password': PASSWORD}
+        yield 'POST /api/users', 'POST', '/api/users', '', JSON, credentials
+        status, _, body = yield 'PUT /api/users', 'PUT', '/api/users', '', JSON, dict(
+            credentials, new_password=NEW_PASSWORD)
+        user_id = data_of(body).get('id')
+        yield 'PATCH /api/users', 'PATCH', '/api/users', '', JSON, {
+            'username': username, 'password': NEW_PASSWORD, 'new_password': PASSWORD}
+        yield 'POST /api/credentials', 'POST', '/api/credentials', '', JSON, credentials
+        yield 'GET /api/users', 'GET', '/api/users', f'username={username}', SUPER, None
+        if user_id:
+            yield 'GET /api/users/{user_id}', 'GET', f'/api/users/{user_id}', '', SUPER, None
+            yield 'DELETE /api/users/{user_id}', 'DELETE', f'/api/users/{user_id}', '', SUPER, None
+
+        yield 'GET /api/astronauts', 'GET', '/api/astronauts', 'limit=100', auth, None
+        yield 'GET /api/astronauts?sort', 'GET', '/api/astronauts', 'sort=-hoursInSpace&limit=100', auth, None
+        yield 'GET /api/astronauts?skill', 'GET', '/api/astronauts', f'skill={quote(rnd.choice(ctx.skills))}&limit=100', auth, None
+        yield 'GET /api/astronauts?q', 'GET', '/api/astronauts', f'q=First{rnd.randint(0, 99)}&limit=20', auth, None
+        status, _, body = yield 'POST /api/astronauts', 'POST', '/api/astronauts', '', auth_json, new_astronaut(
+            tag, rnd, ctx.skills)
+        created = data_of(body).get('id')
+        yield 'POST /api/astronauts/batch', 'POST', '/api/astronauts/batch', '', auth_json, [
+            new_astronaut(f'{tag}b{i}', rnd, ctx.skills) for i in range(10)]
+        yield ('GET /api/astronauts/export', 'GET', '/api/astronauts/export',
+               f'hoursInSpace%5Bgte%5D=1995&skill={quote(rnd.choice(ctx.skills))}', auth, None)
+        yield 'GET /api/astronauts/stats', 'GET', '/api/astronauts/stats', '', auth, None
+        yield 'GET /api/astronauts/{id_}', 'GET', f'/api/astronauts/{rnd.choice(ctx.ids)}', '', auth, None
+        sample = rnd.sample(ctx.ids, min(20, len(ctx.ids)))
+        yield 'GET /api/astronauts?ids', 'GET', '/api/astronauts', f"ids={','.join(sample)}", auth, None
+        yield 'POST /api/astronauts/lookup', 'POST', '/api/astronauts/lookup', '', auth_json, {
+            'ids': rnd.sample(ctx.ids, min(100, len(ctx.ids)))}
+        if created:
+            yield 'PATCH /api/astronauts/{id_}', 'PATCH', f'/api/astronauts/{created}', '', auth_json, {
+                'hoursInSpace': rnd.randint(0, 2000)}
+            yield 'DELETE /api/astronauts/{id_}', 'DELETE', f'/api/astronauts/{created}', '', auth, None
+        if ctx.metrics:
+            yield 'GET /metrics', 'GET', '/metrics', '', {}, None
+
+# Route templates every_route covers, checked against the app's router.
+COVERED_ROUTES = {
+    '/', '/api/users', '/api/users/{user_id}', '/api/credentials', '/api/astronauts',
+    '/api/astronauts/batch', '/api/astronauts/export', '/api/astronauts/lookup', '/api/astronauts/stats',
+    '/api/astronauts/{id_}',
+    '/metrics',
+}
+
+def login_storm(ctx, rnd, client):
+    while True:
+        credentials = {'username': f'user{rnd.randrange(ctx.users)}', 'password': PASSWORD}
+        yield 'POST /api/credentials', 'POST', '/api/credentials', '', JSON, credentials
+
+def list_polling(ctx, rnd, client):
+    etags = {}
+    while True:
+        query = 'limit=100'
+        for _ in range(rnd.randint(1, 5)):
+            headers = dict(ctx.auth, **({'If-None-Match': etags[query]} if etags.get(query) else {}))
+            status, response_headers, body = yield 'GET /api/astronauts', 'GET', '/api/astronauts', query, headers, None
+            if status == 200:
+                etags[query] = response_headers.get('etag')
+                cursor = json.loads(body).get('next')
+                if not cursor:
+                    break
+                next_query = f'limit=100&after={cursor}'
+            elif status == 304:
+                # Unchanged pages keep the cursor they were fetched with.
+                next_query = etags.get(('next', query))
+                if not next_query:
+                    break
+            else:
+                break
+            etags[('next', query)] = next_query
+            query = next_query
+        headers = dict(ctx.auth, **({'If-None-Match': etags['stats']} if etags.get('stats') else {}))
+        status, response_headers, _ = yield 'GET /api/astronauts/stats', 'GET', '/api/astronauts/stats', '', headers, None
+        if status == 200:
+            etags['stats'] = response_headers.get('etag')
+
+def mixed(ctx, rnd, client):
+    auth_json = dict(ctx.auth, **JSON)
+    while True:
+        id_ = rnd.choice(ctx.ids)
+        if rnd.random() < 0.8:
+            yield 'GET /api/astronauts/{id_}', 'GET', f'/api/astronauts/{id_}', '', ctx.auth, None
+        else:
+            yield 'PATCH /api/astronauts/{id_}', 'PATCH', f'/api/astronauts/{id_}', '', auth_json, {
+                'hoursInSpace': rnd.randint(0, 2000), 'active': rnd.random() < 0.5}
+
+SCENARIOS = OrderedDict([
+    ('routes', every_route),
+    ('login_storm', login_storm),
+    ('list_polling', list_polling),
+    ('mixed', mixed),
+])
+
+class Recorder(object):
+    """Latencies and errors of one client, merged once the run is over."""
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(lambda: defaultdict(int))
+
+    def record(self, label, status, seconds):
+        if 200 <= status < 300 or status == 304:
+            self.samples[label].append(seconds * 1000)
+        else:
+            self.errors[label][str(status)] += 1
+
+def summarize(recorders, duration, **fields):
+    samples, errors = defaultdict(list), defaultdict(lambda: defaultdict(int))
+    for recorder in recorders:
+        for label, values in recorder.samples.items():
+            samples[label] += values
+        for label, counts in recorder.errors.items():
+            for status, n in counts.items():
+                errors[label][status] += n
+    rows = []
+    labels = sorted(set(samples) | set(errors))
+    everything = [value for label in labels for value in samples[label]]
+    for label, values in [(label, samples[label]) for label in labels] + [('*', everything)]:
+        failed = ({status: n for label in labels for status, n in errors[label].items()} if label == '*'
+                  else dict(errors[label]))
+        rows.append(OrderedDict(fields, route=label, requests=len(values), rps=round(len(values) / duration, 1),
+                                p50_ms=rounded(percentile(values, 50)), p95_ms=rounded(percentile(values, 95)),
+                                p99_ms=rounded(percentile(values, 99)), errors=failed))
+    return rows
+
+def rounded(value):
+    return None if value is None else round(value, 3)
+
+def run_inprocess(app, scenario, ctx, clients, duration):
+    deadline = time.perf_counter() + duration
+    recorders = [Recorder() for _ in range(clients)]
+
+    def client(n):
+        steps = scenario(ctx, random.Random(n), n)
+        step = next(steps)
+        while time.perf_counter() < deadline:
+            label, method, path, query, headers, body = step
+            started = time.perf_counter()
+            status, response_headers, payload = call(app, method, path, headers, body, query)
+            status = int(status[:3])
+            recorders[n].record(label, status, time.perf_counter() - started)
+            step = steps.send((status, {k.lower(): v for k, v in response_headers.items()}, payload))
+        steps.close()
+
+    threads = [threading.Thread(target=client, args=(n, )) for n in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return recorders
+
+def run_http(port, scenario, ctx, clients, duration):
+    from benchmarks.asgi_load import fetch
+
+    recorders = [Recorder() for _ in range(clients)]
+
+    async def client(n, deadline):
+        steps = scenario(ctx, random.Random(n), n)
+        step = next(steps)
+        while time.perf_counter() < deadline:
+            label, method, path, query, headers, body = step
+            payload = b'' if body is None else json.dumps(body).encode('utf-8')
+            started = time.perf_counter()
+            try:
+                status, response_headers, content = await fetch(
+                    port, method, f'{path}?{query}' if query else path, headers, payload)
+            except (OSError, IndexError, ValueError, asyncio.IncompleteReadError):
+                status, response_headers, content = 0, {}, b''
+            recorders[n].record(label, status, time.perf_counter() - started)
+            step = steps.send((status, response_headers, content))
+        steps.close()
+
+    async def run():
+        deadline = time.perf_counter() + duration
+        await asyncio.gather(*(client(n, deadline) for n in range(clients)))
+
+    asyncio.run(run())
+    return recorders
+
+def routes_of(app):
+    """ uri templates registered on a falcon 2 app (walks its compiled router) """
+    def walk(nodes):
+        for node in nodes:
+            if node.method_map:
+                yield node.uri_template
+            yield from walk(node.children)
+    return set(walk(app._router._roots))
+
+def serve(args):
+    """Runs in the server process: seeds like the in-process run, then serves."""
+    from benchmarks.asgi_load import run_server
+    import main
+
+    seed_astronauts(count(args.astronauts))
+    seed_users(count(args.users), PASSWORD)
+    run_server(args.server, args.port)
+
+def login_http(port):
+    from benchmarks.asgi_load import fetch
+
+    credentials = json.dumps({'username': 'user0', 'password': PASSWORD}).encode('utf-8')
+    _, _, body = asyncio.run(fetch(port, 'POST', '/api/credentials', JSON, credentials))
+    return {'Authorization': 'JWT ' + json.loads(body)['jwt']}
+
+def commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, universal_newlines=True).stdout.strip() or None
+    except OSError:
+        return None
+
+def compare(rows, previous_path):
+    with open(previous_path) as previous_file:
+        previous = {(row['mode'], row['scenario'], row['route']): row
+                    for row in json.load(previous_file)['results']}
+
+    def change(new, old):
+        return round((new - old) / old * 100, 1) if new is not None and old else None
+
+    for row in rows:
+        old = previous.get((row['mode'], row['scenario'], row['route']))
+        if old:
+            report(mode=row['mode'], scenario=row['scenario'], route=row['route'],
+                   rps_change_pct=change(row['rps'], old['rps']),
+                   p50_change_pct=change(row['p50_ms'], old['p50_ms']),
+                   p99_change_pct=change(row['p99_ms'], old['p99_ms']))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--astronauts', default='1k')
+    parser.add_argument('--users', default='10k')
+    parser.add_argument('--modes', default='inprocess,server')
+    parser.add_argument('--server', choices=['wsgi', 'asgi'], default='wsgi')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--output')
+    parser.add_argument('--compare')
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+
+    use_database()
+    import main
+    from benchmarks.asgi_load import free_port, server_stats, wait_for
+    from conf.config import METRICS_ENABLED
+
+    missing = routes_of(main.application) - COVERED_ROUTES
+    if missing:
+        sys.exit(f"No benchmark step for {', '.join(sorted(missing))}, add it to every_route")
+
+    # user0 is the one the clients log in with.
+    astronauts, users = count(args.astronauts), max(1, count(args.users))
+    scenarios = [(name, SCENARIOS[name]) for name in args.scenarios.split(',')]
+    rows = []
+    for mode in args.modes.split(','):
+        process = None
+        started = time.perf_counter()
+        if mode == 'inprocess':
+            seed_astronauts(astronauts)
+            seed_users(users, PASSWORD)
+        else:
+            port = free_port()
+            env = dict(os.environ, DATABASE=use_database())
+            process = subprocess.Popen(
+                [sys.executable, '-m', 'benchmarks.suite', '--serve', '--server', args.server, '--port', str(port),
+                 '--astronauts', str(astronauts), '--users', str(users)],
+                env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            if process:
+                wait_for(port, process, timeout=600 + astronauts / 1000)
+            report(mode=mode, astronauts=astronauts, users=users,
+                   seed_seconds=round(time.perf_counter() - started, 1))
+            for name, scenario in scenarios:
+                # Tokens expire, so every scenario logs in again.
+                auth = login_http(port) if process else login(main.application, 'user0', PASSWORD)
+                ctx = Context(astronauts, users, auth, METRICS_ENABLED)
+                if process:
+                    recorders = run_http(port, scenario, ctx, args.clients, args.duration)
+                    rss = server_stats(process.pid).get('peak_rss_mb')
+                else:
+                    recorders = run_inprocess(main.application, scenario, ctx, args.clients, args.duration)
+                    rss = peak_rss_mb()
+                results = summarize(recorders, args.duration, mode=mode, scenario=name)
+                results[-1]['peak_rss_mb'] = rss
+                for row in results:
+                    report(**row)
+                rows += results
+        finally:
+            if process:
+                process.terminate()
+                process.wait()
+
+    if args.output:
+        document = OrderedDict([
+            ('commit', commit()),
+            ('python', platform.python_version()),
+            ('cpus', os.cpu_count()),
+            ('config', OrderedDict(astronauts=astronauts, users=users, clients=args.clients,
+                                   duration=args.duration, server=args.server)),
+            ('results', rows),
+        ])
+        with open(args.output, 'w') as output:
+            json.dump(document, output, indent=2)
+    if args.compare:
+        compare(rows, args.compare)
+
+if __name__ == '__main__':
+    main()
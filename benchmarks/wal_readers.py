@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""Read throughput of `fetch_astronauts` while another thread keeps writing.
+
+    python -m benchmarks.wal_readers [--rows 5000] [--readers 4] [--seconds 3]
+
+Every journal mode is measured without and with a concurrent writer in a
+fresh interpreter. With WAL the reads/sec should stay flat once the writer
+is on; with the rollback journal they drop.
+"""
+import argparse
+import random
+import threading
+import time
+
+from benchmarks.common import report, run_child, seed_astronauts, use_database
+
+def measure(args):
+    use_database(DB_JOURNAL_MODE=args.mode)
+    from db_ import database as db, init_session
+
+    init_session()
+    seed_astronauts(args.rows)
+    ids = [astronaut['id'] for astronaut in db.fetch_astronauts()]
+
+    stop = threading.Event()
+    reads = [0] * args.readers
+    writes = [0]
+
+    def read(slot):
+        rnd = random.Random(slot)
+        while not stop.is_set():
+            db.fetch_astronauts({'id_': rnd.choice(ids)})
+            db.fetch_astronauts({'active': 'True'})
+            reads[slot] += 2
+
+    def write():
+        rnd = random.Random(-1)
+        while not stop.is_set():
+            db.update_astronaut_info(rnd.choice(ids), {'hoursInSpace': rnd.randint(0, 2000)})
+            writes[0] += 1
+
+    threads = [threading.Thread(target=read, args=(slot, )) for slot in range(args.readers)]
+    if args.writers:
+        threads.append(threading.Thread(target=write))
+    for thread in threads:
+        thread.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    report(mode=args.mode, writer=bool(args.writers), rows=args.rows,
+           reads_per_sec=round(sum(reads) / args.seconds, 1),
+           writes_per_sec=round(writes[0] / args.seconds, 1))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=5000)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=3)
+    parser.add_argument('--mode')
+    parser.add_argument('--writers', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.mode:
+        measure(args)
+        return
+
+    for mode in ('delete', 'wal'):
+        for writers in (0, 1):
+            for line in run_child(
+                    'benchmarks.wal_readers', '--mode', mode, '--writers', writers,
+                    '--rows', args.rows, '--readers', args.readers, '--seconds', args.seconds):
+                report(**line)
+
+if __name__ == '__main__':
+    main()
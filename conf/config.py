@@ -14,18 +14,120 @@ APP_NAME = 'Dummy API'
 API_SECRET_KEY = os.environ.get('API_SECRET_KEY', 'whatever')
 SUPER_ADMIN_KEY = os.environ.get('SUPER_ADMIN_KEY', 'SUPER')
 JWT_EXPIRATION_SECONDS = int(os.environ.get('JWT_EXPIRATION_TIME', '300'))
+# Password hashing: 'pbkdf2_sha256' or 'scrypt', its cost (PBKDF2 iterations
+# or scrypt's N, a power of 2) and the processes doing the work (0 hashes on
+# the request thread). Hashes made with other settings are upgraded on the
+# next login.
+PASSWORD_HASH_ALGORITHM = os.environ.get('PASSWORD_HASH_ALGORITHM', 'pbkdf2_sha256')
+PASSWORD_HASH_DEFAULT_COSTS = {'pbkdf2_sha256': 120000, 'scrypt': 2 ** 15}
+PASSWORD_HASH_COST = int(os.environ.get('PASSWORD_HASH_COST',
+                                        str(PASSWORD_HASH_DEFAULT_COSTS.get(PASSWORD_HASH_ALGORITHM, 0))))
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', str(os.cpu_count() or 1)))
+# Verified tokens remembered until they expire, so repeated requests with the
+# same token skip the signature check (0 disables it).
+JWT_CACHE_SIZE = int(os.environ.get('JWT_CACHE_SIZE', '4096'))
+
+# =============================================================================
+# JSON
+# =============================================================================
+# 'auto' picks the fastest codec installed (orjson), 'json' forces the stdlib.
+JSON_CODEC = os.environ.get('JSON_CODEC', 'auto')
 
 # =============================================================================
 # Logging
 # =============================================================================
 LOG = logging.getLogger()
-LOG.setLevel(logging.DEBUG)
+LOG.setLevel(os.environ.get('LOG_LEVEL', 'DEBUG').upper())
+
+# =============================================================================
+# METRICS
+# =============================================================================
+# Request latency and per-phase timings served on /metrics (Prometheus text
+# format). Each worker process reports its own requests.
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
 
 # =============================================================================
 # DATABASE
 # =============================================================================
 # Setting up the database
-DATABASE = "db_/data.db"
+DATABASE = os.environ.get('DATABASE', "db_/data.db")
+# Dummy astronauts put in on startup: 'never', or 'empty' to seed only a
+# database without astronauts ('reset' drops every table first, on every
+# start: only for throwaway databases). The schema is migrated either way,
+# once, by the first worker (or beforehand with `python -m db_`).
+DB_SEED = os.environ.get('DB_SEED', 'never').lower()
+# Warm connections kept per worker process and how long a request may wait
+# for one before giving up.
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '8'))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '30'))
+# Compiled statements kept by sqlite3 per connection.
+DB_STATEMENT_CACHE_SIZE = int(os.environ.get('DB_STATEMENT_CACHE_SIZE', '256'))
+# Read-through cache of astronaut lookups (0 disables it).
+ASTRONAUT_CACHE_SIZE = int(os.environ.get('ASTRONAUT_CACHE_SIZE', '1024'))
+ASTRONAUT_CACHE_TTL = float(os.environ.get('ASTRONAUT_CACHE_TTL', '30'))
+# Cache of listing and search pages, bounded by the rows they hold in total
+# rather than by pages, since one page can be PAGE_SIZE_MAX rows (0 disables
+# it). Shares the TTL above.
+LISTING_CACHE_ROWS = int(os.environ.get('LISTING_CACHE_ROWS', '50000'))
+# Storage mode: 'wal' lets reads carry on while a write is in progress,
+# 'delete' is SQLite's default rollback journal.
+DB_JOURNAL_MODE = os.environ.get('DB_JOURNAL_MODE', 'wal')
+# Group commit: single-row writes (users, PATCH and DELETE of astronauts)
+# are queued for one writer thread, which commits the ones waiting together.
+# It waits up to DB_GROUP_COMMIT_WINDOW seconds for more to join a
+# transaction of at most DB_GROUP_COMMIT_SIZE writes (0 commits every write
+# on its own, in the request's thread).
+DB_GROUP_COMMIT_WINDOW = float(os.environ.get('DB_GROUP_COMMIT_WINDOW', '0.002'))
+DB_GROUP_COMMIT_SIZE = int(os.environ.get('DB_GROUP_COMMIT_SIZE', '256'))
+# 'FULL' syncs every commit to disk, so a write acknowledged to a client
+# survives a power failure; group commit shares that sync between the writes
+# of a transaction, which is why it is the default with the queue on. With
+# 'NORMAL' and WAL, commits are only synced at checkpoints: faster, but the
+# last acknowledged writes can be lost on power failure (not on a crash of
+# the process).
+DB_SYNCHRONOUS = os.environ.get('DB_SYNCHRONOUS', 'FULL' if DB_GROUP_COMMIT_SIZE else 'NORMAL')
+DB_MMAP_SIZE = int(os.environ.get('DB_MMAP_SIZE', str(256 * 1024 * 1024)))
+# Negative values are KiB, positive values are pages (see PRAGMA cache_size).
+DB_CACHE_SIZE = int(os.environ.get('DB_CACHE_SIZE', '-16000'))
+# Applied once to every pooled connection when it is opened.
+DB_PRAGMAS = {
+    'foreign_keys': 'ON',
+    'busy_timeout': int(DB_POOL_TIMEOUT * 1000),
+    'temp_store': 'MEMORY',
+    'mmap_size': DB_MMAP_SIZE,
+    'cache_size': DB_CACHE_SIZE,
+}
+# Only the writer connection changes how the file is journaled.
+DB_WRITER_PRAGMAS = {
+    **DB_PRAGMAS,
+    'journal_mode': DB_JOURNAL_MODE,
+    'synchronous': DB_SYNCHRONOUS,
+}
+
+# =============================================================================
+# PAGINATION
+# =============================================================================
+PAGE_SIZE_DEFAULT = int(os.environ.get('PAGE_SIZE_DEFAULT', '100'))
+PAGE_SIZE_MAX = int(os.environ.get('PAGE_SIZE_MAX', '1000'))
+# Rows pulled from SQLite per JSON fragment when a listing is streamed or
+# exported.
+STREAM_CHUNK_SIZE = int(os.environ.get('STREAM_CHUNK_SIZE', '500'))
+
+# =============================================================================
+# BATCH IMPORT
+# =============================================================================
+# Rows validated and inserted per transaction by POST /api/astronauts/batch.
+BATCH_CHUNK_SIZE = int(os.environ.get('BATCH_CHUNK_SIZE', '5000'))
+
+# =============================================================================
+# ASGI
+# =============================================================================
+# Threads running the application behind main:asgi_application. Connections
+# beyond that wait in the event loop without holding a thread.
+ASGI_THREADS = int(os.environ.get('ASGI_THREADS', str(DB_POOL_SIZE * 4)))
+# Request bodies up to this size are buffered in memory, larger ones in a
+# temporary file.
+ASGI_SPOOL_SIZE = int(os.environ.get('ASGI_SPOOL_SIZE', str(1024 * 1024)))
 
 # =============================================================================
 # MAPPER to catch regular status_codes (ex.: 404) and convert it
@@ -1,10 +1,17 @@
 
-from conf.config import LOG, DATABASE
-from db_.database import create_connection, create_table, drop_table, add_astronauts_bulk
+from contextlib import contextmanager
+
+from conf.config import LOG, DATABASE, DB_SEED
+from db_.database import (writer, drop_table, add_astronauts_bulk, backfill_astronaut_skills,
+                          rebuild_astronaut_search, rebuild_astronaut_stats, convert_active_flags,
+                          ASTRONAUT_TABLES)
 from db_.dummy import ASTRONAUTS
 
-sql_drop_users = "DELETE FROM users;"
-sql_drop_astronauts = "DELETE FROM astronauts;"
+try:
+    import fcntl
+except ImportError:
+    # Windows: BEGIN IMMEDIATE alone keeps the workers from migrating at once.
+    fcntl = None
 
 sql_create_users_table = """CREATE TABLE IF NOT EXISTS users (
                                 id_ text PRIMARY KEY UNIQUE,
@@ -23,17 +30,169 @@ sql_create_astronauts_table = """CREATE TABLE IF NOT EXISTS astronauts (
                                 UNIQUE(firstName,lastName)
 );"""
 
-def init_session():
-    conn = create_connection(DATABASE)
-    if conn is not None:
-        drop_table('users')
-        drop_table('astronauts')
-        create_table(conn, sql_create_users_table)
-        create_table(conn, sql_create_astronauts_table)
-        add_astronauts_bulk(ASTRONAUTS)
-    else:
-        message = "Cannot create database connection!"
-        LOG.error(message)
-        raise Exception(message)
-    
-    conn.close()
+# One row per astronaut and skill; the primary key doubles as the skill index.
+sql_create_astronaut_skills_table = """CREATE TABLE IF NOT EXISTS astronaut_skills (
+                                astronaut_id text NOT NULL REFERENCES astronauts (id_) ON DELETE CASCADE,
+                                skill text NOT NULL,
+                                PRIMARY KEY (skill, astronaut_id)
+) WITHOUT ROWID;"""
+
+# Name search index. It reads names back from astronauts (external content),
+# so it is keyed by the astronauts rowid and kept in sync by the triggers
+# below. Run `INSERT INTO astronauts_fts (astronauts_fts) VALUES ('rebuild')`
+# after a VACUUM, which may renumber those rowids.
+sql_create_astronauts_fts_table = """CREATE VIRTUAL TABLE IF NOT EXISTS astronauts_fts USING fts5 (
+                                firstName,
+                                lastName,
+                                content='astronauts',
+                                tokenize='unicode61 remove_diacritics 2',
+                                prefix='2 3'
+);"""
+
+sql_create_astronauts_fts_triggers = [
+    """CREATE TRIGGER IF NOT EXISTS astronauts_fts_insert AFTER INSERT ON astronauts BEGIN
+        INSERT INTO astronauts_fts (rowid, firstName, lastName)
+        VALUES (new.rowid, new.firstName, new.lastName);
+    END;""",
+    """CREATE TRIGGER IF NOT EXISTS astronauts_fts_delete AFTER DELETE ON astronauts BEGIN
+        INSERT INTO astronauts_fts (astronauts_fts, rowid, firstName, lastName)
+        VALUES ('delete', old.rowid, old.firstName, old.lastName);
+    END;""",
+    """CREATE TRIGGER IF NOT EXISTS astronauts_fts_update AFTER UPDATE OF firstName, lastName ON astronauts BEGIN
+        INSERT INTO astronauts_fts (astronauts_fts, rowid, firstName, lastName)
+        VALUES ('delete', old.rowid, old.firstName, old.lastName);
+        INSERT INTO astronauts_fts (rowid, firstName, lastName)
+        VALUES (new.rowid, new.firstName, new.lastName);
+    END;""",
+]
+
+# Totals served by GET /api/astronauts/stats, kept up to date by the triggers
+# below so reading them never touches astronauts or astronaut_skills.
+sql_create_astronaut_stats_table = """CREATE TABLE IF NOT EXISTS astronaut_stats (
+                                id integer PRIMARY KEY CHECK (id = 1),
+                                astronauts int NOT NULL,
+                                active int NOT NULL,
+                                hoursInSpace int NOT NULL
+);"""
+
+sql_create_skill_stats_table = """CREATE TABLE IF NOT EXISTS skill_stats (
+                                skill text PRIMARY KEY,
+                                astronauts int NOT NULL
+) WITHOUT ROWID;"""
+
+sql_create_stats_triggers = [
+    """CREATE TRIGGER IF NOT EXISTS astronaut_stats_insert AFTER INSERT ON astronauts BEGIN
+        UPDATE astronaut_stats SET astronauts = astronauts + 1, active = active + (new.active != 0),
+                                   hoursInSpace = hoursInSpace + new.hoursInSpace;
+    END;""",
+    """CREATE TRIGGER IF NOT EXISTS astronaut_stats_delete AFTER DELETE ON astronauts BEGIN
+        UPDATE astronaut_stats SET astronauts = astronauts - 1, active = active - (old.active != 0),
+                                   hoursInSpace = hoursInSpace - old.hoursInSpace;
+    END;""",
+    """CREATE TRIGGER IF NOT EXISTS astronaut_stats_update AFTER UPDATE OF active, hoursInSpace ON astronauts BEGIN
+        UPDATE astronaut_stats SET active = active - (old.active != 0) + (new.active != 0),
+                                   hoursInSpace = hoursInSpace - old.hoursInSpace + new.hoursInSpace;
+    END;""",
+    """CREATE TRIGGER IF NOT EXISTS skill_stats_insert AFTER INSERT ON astronaut_skills BEGIN
+        INSERT INTO skill_stats (skill, astronauts) VALUES (new.skill, 1)
+        ON CONFLICT (skill) DO UPDATE SET astronauts = astronauts + 1;
+    END;""",
+    """CREATE TRIGGER IF NOT EXISTS skill_stats_delete AFTER DELETE ON astronaut_skills BEGIN
+        UPDATE skill_stats SET astronauts = astronauts - 1 WHERE skill = old.skill;
+        DELETE FROM skill_stats WHERE skill = old.skill AND astronauts = 0;
+    END;""",
+]
+
+# Schema steps in the order they were introduced. `PRAGMA user_version` holds
+# how many of them a database has applied, so only add steps at the end and
+# never change one that has shipped. Databases created before the version was
+# kept start at 0 and run everything again, which is why each step must also
+# be safe to repeat. Every column accepted by `build_filters` or used for a
+# lookup needs an index (firstName is covered by the UNIQUE constraint).
+# Callables are data migrations and get the open connection.
+migrations = [
+    sql_create_users_table,
+    sql_create_astronauts_table,
+    "CREATE INDEX IF NOT EXISTS idx_users_username ON users (username);",
+    "CREATE INDEX IF NOT EXISTS idx_astronauts_lastName ON astronauts (lastName);",
+    # hoursInSpace ranges and sorts, with or without an active filter; id_ is
+    # the tiebreaker of the sort and of its keyset cursor.
+    "CREATE INDEX IF NOT EXISTS idx_astronauts_active_hoursInSpace ON astronauts (active, hoursInSpace, id_);",
+    "CREATE INDEX IF NOT EXISTS idx_astronauts_hoursInSpace ON astronauts (hoursInSpace, id_);",
+    "DROP INDEX IF EXISTS idx_astronauts_active;",
+    sql_create_astronaut_skills_table,
+    "CREATE INDEX IF NOT EXISTS idx_astronaut_skills_astronaut_id ON astronaut_skills (astronaut_id);",
+    backfill_astronaut_skills,
+    sql_create_astronauts_fts_table,
+    *sql_create_astronauts_fts_triggers,
+    rebuild_astronaut_search,
+    sql_create_astronaut_stats_table,
+    sql_create_skill_stats_table,
+    *sql_create_stats_triggers,
+    rebuild_astronaut_stats,
+    convert_active_flags,
+    # Active filters sorted by id_, the default listing order: pages are read
+    # in index order instead of sorting every matching row.
+    "CREATE INDEX IF NOT EXISTS idx_astronauts_active_id ON astronauts (active, id_);",
+]
+
+SEED_MODES = ('never', 'empty', 'reset')
+
+@contextmanager
+def migration_lock(path=f"{DATABASE}-migrate.lock"):
+    """ held by the process migrating or seeding the database, so the other
+        workers wait for it instead of for SQLite's busy timeout
+    """
+    if fcntl is None:
+        yield
+        return
+    with open(path, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version;").fetchone()[0]
+
+def needs_seed(conn):
+    return not conn.execute("SELECT EXISTS (SELECT 1 FROM astronauts);").fetchone()[0]
+
+def init_session(seed=DB_SEED):
+    """ brings the schema up to date and seeds the dummy astronauts if asked.
+        Cheap when there is nothing to do, so every worker calls it on import
+        and only the first one after a deployment does any work.
+    :param seed: 'never', 'empty' (only into an empty astronauts table) or
+        'reset' (drops every table first, the data is lost)
+    :return: (schema version found, schema version now)
+    """
+    if seed not in SEED_MODES:
+        raise ValueError(f"Unknown seed mode '{seed}', expected one of {', '.join(SEED_MODES)}")
+    with writer.connection() as conn:
+        found = schema_version(conn)
+        if found >= len(migrations) and (seed == 'never' or seed == 'empty' and not needs_seed(conn)):
+            return found, found
+
+    with migration_lock(), writer.connection() as conn:
+        # One transaction: a worker that crashes half way leaves the old
+        # schema behind, and the others see the new one or none of it.
+        conn.execute("BEGIN IMMEDIATE;")
+        if seed == 'reset':
+            for table in ('users', ) + tuple(reversed(ASTRONAUT_TABLES)):
+                drop_table(table)
+            conn.execute("PRAGMA user_version = 0;")
+        # Another worker may have migrated while this one waited for the lock.
+        found = schema_version(conn)
+        for migration in migrations[found:]:
+            if callable(migration):
+                migration(conn)
+            else:
+                conn.execute(migration)
+        if found < len(migrations):
+            conn.execute(f"PRAGMA user_version = {len(migrations)};")
+            LOG.info(f"Database schema migrated from version {found} to {len(migrations)}")
+        if seed != 'never' and needs_seed(conn):
+            add_astronauts_bulk(ASTRONAUTS)
+            LOG.info(f"Database seeded with {len(ASTRONAUTS)} astronauts")
+    return found, max(found, len(migrations))
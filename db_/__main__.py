@@ -0,0 +1,22 @@
+"""Migrates and optionally seeds the database, once per deployment.
+
+    python -m db_ [--seed never|empty|reset]
+
+Run before starting the workers so none of them has to wait for it.
+"""
+import argparse
+
+from conf.config import DATABASE, DB_SEED
+from db_ import SEED_MODES, init_session
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seed', choices=SEED_MODES, default=DB_SEED,
+                        help="'reset' drops every table, users included, and starts over")
+    args = parser.parse_args()
+
+    found, version = init_session(seed=args.seed)
+    print(f"{DATABASE} is at schema version {version} (was {found})")
+
+if __name__ == '__main__':
+    main()
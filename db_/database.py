@@ -1,75 +1,138 @@
-from contextlib import suppress
+import os
+import re
+from contextlib import closing, nullcontext, suppress
 from collections import OrderedDict
+from urllib.request import pathname2url
 
 import sqlite3
 from sqlite3 import Error
 
-from conf.config import LOG, DATABASE
-
-def create_connection(db_file):
+from conf.config import (LOG, DATABASE, DB_POOL_SIZE, DB_POOL_TIMEOUT, DB_PRAGMAS, DB_WRITER_PRAGMAS,
+                         DB_STATEMENT_CACHE_SIZE, DB_GROUP_COMMIT_WINDOW, DB_GROUP_COMMIT_SIZE,
+                         ASTRONAUT_CACHE_SIZE, ASTRONAUT_CACHE_TTL, LISTING_CACHE_ROWS, METRICS_ENABLED)
+from db_.generations import SharedGenerations
+from db_.pool import ConnectionPool
+from db_.statements import StatementCache
+from db_.write_queue import WriteQueue
+from utils.cache import LRUCache
+from utils.metrics import DB, Timer, metrics, shape_id
+
+def create_connection(db_file, **kwargs):
     """ create a database connection to the SQLite database
         specified by db_file
     :param db_file: database file
+    :param kwargs: extra arguments for sqlite3.connect
     :return: Connection object or None
     """
     try:
-        conn = sqlite3.connect(db_file)
+        conn = sqlite3.connect(db_file, **kwargs)
         return conn
     except Error as ex:
         LOG.error(ex)
         raise Exception(ex)
     return None
 
-def create_table(conn, create_table_sql):
-    """ create a table from the create_table_sql statement
-    :param conn: Connection object
-    :param create_table_sql: a CREATE TABLE statement
-    :return:
+READ_ONLY_URI = f"file:{pathname2url(os.path.abspath(DATABASE))}?mode=ro"
+
+# Reads go to read-only connections shared between the threads of a worker,
+# writes are serialized through a single writer connection.
+readers = ConnectionPool(
+    lambda: create_connection(READ_ONLY_URI, uri=True, check_same_thread=False,
+                              cached_statements=DB_STATEMENT_CACHE_SIZE),
+    size=DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT, pragmas=DB_PRAGMAS)
+writer = ConnectionPool(
+    lambda: create_connection(DATABASE, check_same_thread=False,
+                              cached_statements=DB_STATEMENT_CACHE_SIZE),
+    size=1, timeout=DB_POOL_TIMEOUT, pragmas=DB_WRITER_PRAGMAS)
+# Single-row writes of concurrent requests share a transaction; bulk writes
+# use `writer` directly.
+writes = WriteQueue(writer, window=DB_GROUP_COMMIT_WINDOW, size=DB_GROUP_COMMIT_SIZE)
+# One parameterized statement per filter/patch shape.
+statements = StatementCache()
+# Rows of single-astronaut lookups by id and of every other filter set. A
+# write drops the id it touched and every listing.
+astronaut_cache = LRUCache(ASTRONAUT_CACHE_SIZE, ttl=ASTRONAUT_CACHE_TTL)
+# Pages are weighed by their rows (an empty one still counts as one).
+listing_cache = LRUCache(LISTING_CACHE_ROWS, ttl=ASTRONAUT_CACHE_TTL, weigh=lambda rows: max(len(rows), 1))
+# Write counters shared with the other workers, and the value each local
+# cache was last validated against.
+generations = SharedGenerations(f"{DATABASE}-gen", ['users', 'astronauts'])
+cache_generations = {}
+
+# Statement -> the short id its timings are labelled with on /metrics.
+query_shapes = {}
+
+ASTRONAUT_COLUMNS = ["id_", "active", "firstName", "lastName", "skills", "hoursInSpace", "picture"]
+# Tables whose content is served from the astronaut caches, astronauts first.
+ASTRONAUT_TABLES = ("astronauts", "astronaut_skills", "astronauts_fts", "astronaut_stats", "skill_stats")
+# Listings can be ordered by these columns; id_ breaks ties so pages are stable.
+SORT_FIELDS = ["id_", "hoursInSpace"]
+# Columns accepted as `column[op]` range filters, e.g. hoursInSpace[gte].
+RANGE_FIELDS = ["hoursInSpace"]
+RANGE_OPERATORS = OrderedDict([("gt", ">"), ("gte", ">="), ("lt", "<"), ("lte", "<=")])
+# Bound parameters per statement: SQLite's default limit before 3.32.
+MAX_VARIABLES = 999
+# Skills one listing may filter by; the statement's placeholder count is
+# padded to a power of two up to it, which bounds the number of shapes.
+MAX_SKILL_FILTERS = 32
+
+def timed(operation, query):
+    """ times a block of the data layer for db_query_duration_seconds and
+        the current request's db phase
+    :param operation: name of the data layer function
+    :param query: its main (parameterized) statement, labelled by shape
+    :return: context manager
     """
-    try:
-        c = conn.cursor()
-        c.execute(create_table_sql)
-    except Error as ex:
-        LOG.error(ex)
-        raise Exception(ex)
+    if not METRICS_ENABLED:
+        return nullcontext()
+    shape = query_shapes.get(query)
+    if shape is None:
+        shape = query_shapes[query] = shape_id(query)
+    return Timer(metrics, ('db_query_duration_seconds', operation, shape), phase=DB)
 
 def replace_user_info(id_, username, password):
-    conn = create_connection(DATABASE)
-    c = conn.cursor()
-    try:
-        c.execute(f"DELETE FROM users WHERE username=?", (username, ))
-        c.execute(
-            "INSERT INTO users(id_, username, password) VALUES(?, ?, ?)", (id_, username, password))
-        conn.commit()
-    except sqlite3.IntegrityError as ex:
-        LOG.error(ex)
-        raise Exception(ex)
-    conn.close()
+    query = statements.get(('delete', 'users', 'username'), lambda: (
+        "DELETE FROM users WHERE username=?"))
+
+    def replace(conn):
+        with closing(conn.cursor()) as c:
+            try:
+                c.execute(query, (username, ))
+                c.execute(
+                    "INSERT INTO users(id_, username, password) VALUES(?, ?, ?)", (id_, username, password))
+            except sqlite3.IntegrityError as ex:
+                LOG.error(ex)
+                raise Exception(ex)
+
+    with timed('replace_user_info', query):
+        writes.run(replace)
+    generations.bump('users')
 
 def create_user(id_, username, password):
-    conn = create_connection(DATABASE)
-    c = conn.cursor()
-    try:
-        c.execute(
-            "INSERT INTO users(id_, username, password) VALUES(?, ?, ?)", (id_, username, password))
-        conn.commit()
-    except sqlite3.IntegrityError as ex:
-        LOG.error(ex)
-        raise Exception(ex)
-    conn.close()
+    query = "INSERT INTO users(id_, username, password) VALUES(?, ?, ?)"
+
+    def insert(conn):
+        with closing(conn.cursor()) as c:
+            try:
+                c.execute(query, (id_, username, password))
+            except sqlite3.IntegrityError as ex:
+                LOG.error(ex)
+                raise Exception(ex)
+
+    with timed('create_user', query):
+        writes.run(insert)
+    generations.bump('users')
 
 def fetch_users(username=None, user_id=None, hide_pass=None):
-    conn = create_connection(DATABASE)
-    c = conn.cursor()
-    if username and user_id:
-        c.execute("SELECT id_, username, password FROM users WHERE id_=? AND username=?", (user_id, username))
-    elif user_id:
-        c.execute("SELECT id_, username, password FROM users WHERE id_=?", (user_id, ))
-    elif username:
-        c.execute("SELECT id_, username, password FROM users WHERE username=?", (username, ))
-    else:
-        c.execute("SELECT id_, username, password FROM users")
-    rows = c.fetchall()
+    keys = tuple(k for k, v in (('id_', user_id), ('username', username)) if v)
+    params = tuple(v for v in (user_id, username) if v)
+    query = statements.get(('select', 'users', keys), lambda: (
+        "SELECT id_, username, password FROM users"
+        + (f" WHERE {' AND '.join(f'{k}=?' for k in keys)}" if keys else "")))
+    with timed('fetch_users', query), readers.connection() as conn:
+        with closing(conn.cursor()) as c:
+            c.execute(query, params)
+            rows = c.fetchall()
     users = []
     for user in rows:
         username = {
@@ -79,109 +142,510 @@ def fetch_users(username=None, user_id=None, hide_pass=None):
         if not hide_pass:
             username['password'] = user[2]
         users.append(username)
-    conn.close()
     return users
 
 def update_password(id_, password):
-    conn = create_connection(DATABASE)
-    c = conn.cursor()
-    c.execute("UPDATE users SET password = ? WHERE id_ = ?", (password, id_))
-    conn.commit()
-    conn.close()
+    query = statements.get(('update', 'users', 'password'), lambda: (
+        "UPDATE users SET password = ? WHERE id_ = ?"))
+
+    def update(conn):
+        with closing(conn.cursor()) as c:
+            c.execute(query, (password, id_))
+
+    with timed('update_password', query):
+        writes.run(update)
+    generations.bump('users')
+
+def invalidate_astronauts(ids=()):
+    for id_ in ids:
+        astronaut_cache.pop(id_)
+    listing_cache.clear()
+    generations.bump('astronauts')
+
+def sync_astronaut_caches():
+    """ drops the local astronaut caches when any worker wrote since """
+    generation = generations.get('astronauts')
+    if cache_generations.get('astronauts') != generation:
+        astronaut_cache.clear()
+        listing_cache.clear()
+        cache_generations['astronauts'] = generation
+
+def cache_stats():
+    return {
+        'astronauts': astronaut_cache.stats(),
+        'listings': listing_cache.stats(),
+    }
+
+def collect_stats():
+    """ pool, statement and cache counters of this worker for /metrics """
+    components = {'readers': readers.stats(), 'writer': writer.stats(), 'writes': writes.stats(),
+                  'statements': statements.stats()}
+    components.update((f'{name}_cache', stats) for name, stats in cache_stats().items())
+    return {(component, stat): value for component, stats in components.items() for stat, value in stats.items()}
+
+metrics.collector('db_stats', 'Connection pool, statement cache and result cache counters.',
+                  ['component', 'stat'], collect_stats)
+metrics.collector('db_query_shape_info', 'Statement reported under each db_query_duration_seconds shape.',
+                  ['shape', 'statement'], lambda: {(shape, query): 1 for query, shape in list(query_shapes.items())})
 
 def delete_from_table(table, id_):
-    conn = create_connection(DATABASE)
-    c = conn.cursor()
-    c.execute(f"DELETE FROM {table} WHERE id_='{id_}';")
-    conn.commit()
-    conn.close()
+    query = statements.get(('delete', table), lambda: f"DELETE FROM {table} WHERE id_ = ?;")
+
+    def delete(conn):
+        with closing(conn.cursor()) as c:
+            c.execute(query, (id_, ))
+
+    with timed('delete_from_table', query):
+        writes.run(delete)
+    if table == 'astronauts':
+        invalidate_astronauts([id_])
+    else:
+        generations.bump(table)
 
 def drop_table(table):
-    conn = create_connection(DATABASE)
+    with writer.connection() as conn:
+        with closing(conn.cursor()) as c:
+            c.execute(f"DROP TABLE IF EXISTS {table};")
+    if table in ASTRONAUT_TABLES:
+        invalidate_astronauts()
+    else:
+        generations.bump(table)
+
+def astronaut_values(astronaut):
+    return (
+        astronaut["id"],
+        astronaut["active"],
+        astronaut["firstName"],
+        astronaut["lastName"],
+        ",".join(astronaut["skills"]),
+        astronaut["hoursInSpace"],
+        astronaut["picture"])
+
+def replace_astronaut_skills(c, astronauts):
+    """ rewrites the astronaut_skills rows of the given astronauts
+    :param c: cursor inside the write transaction
+    :param astronauts: iterable of (id_, list of skills)
+    """
+    astronauts = list(astronauts)
+    c.executemany(statements.get(('delete', 'astronaut_skills'), lambda: (
+        "DELETE FROM astronaut_skills WHERE astronaut_id = ?;")), [(id_, ) for id_, _ in astronauts])
+    c.executemany(statements.get(('insert', 'astronaut_skills'), lambda: (
+        "INSERT OR IGNORE INTO astronaut_skills (astronaut_id, skill) VALUES (?, ?);")),
+        [(id_, skill) for id_, skills in astronauts for skill in skills])
+
+def backfill_astronaut_skills(conn):
+    """ migration: fills astronaut_skills from the comma-joined skills column """
     c = conn.cursor()
-    c.execute(f"DROP TABLE IF EXISTS {table};")
-    conn.commit()
-    conn.close()
+    c.execute("SELECT id_, skills FROM astronauts WHERE id_ NOT IN "
+              "(SELECT astronaut_id FROM astronaut_skills);")
+    replace_astronaut_skills(c, [(id_, skills.split(",")) for id_, skills in c.fetchall()])
 
-def add_astronauts_bulk(astronauts):
-    conn = create_connection(DATABASE)
+def rebuild_astronaut_search(conn):
+    """ migration: indexes existing astronauts when astronauts_fts is new """
     c = conn.cursor()
-    for astronaut in astronauts:
-        skills = ",".join(astronaut["skills"])
-        try:
-            c.execute(
-                f"""INSERT INTO astronauts (
-                    id_, active, firstName, lastName, skills, hoursInSpace, picture)
-                    VALUES (
-                    '{astronaut["id"]}',
-                    '{astronaut["active"]}',
-                    '{astronaut["firstName"]}',
-                    '{astronaut["lastName"]}',
-                    '{skills}',
-                    '{astronaut["hoursInSpace"]}',
-                    '{astronaut["picture"]}');""")
-        except sqlite3.IntegrityError as ex:
-            conn.close()
-            LOG.error(ex)
-            raise Exception(f"{ex} when processing: {astronaut['firstName']} {astronaut['lastName']}")
-    conn.commit()
-    conn.close()
-
-def build_filters(filters):
-    valid_filters = ['id_', 'active', 'firstName', 'lastName']
-    query = ""
-    for k,v in filters.items():
-        if k in valid_filters:
-            query += f"{k} = '{v}' AND "
-    if query:
-        query = f"WHERE {query.rsplit(' AND ', 1)[0]}" 
-    return query
+    c.execute("SELECT EXISTS (SELECT 1 FROM astronauts_fts_docsize);")
+    if not c.fetchone()[0]:
+        c.execute("INSERT INTO astronauts_fts (astronauts_fts) VALUES ('rebuild');")
+
+def compute_astronaut_stats(c):
+    """ aggregates astronauts and astronaut_skills from scratch
+    :param c: cursor
+    :return: ((astronauts, active, hoursInSpace), [(skill, astronauts), ...])
+    """
+    c.execute("SELECT COUNT(*), COALESCE(SUM(active != 0), 0), COALESCE(SUM(hoursInSpace), 0) FROM astronauts;")
+    totals = c.fetchone()
+    c.execute("SELECT skill, COUNT(*) FROM astronaut_skills GROUP BY skill ORDER BY skill;")
+    return totals, c.fetchall()
 
-def fetch_astronauts(filters=None):
-    conn = create_connection(DATABASE)
+def rebuild_astronaut_stats(conn):
+    """ migration: fills astronaut_stats and skill_stats when they are new """
+    c = conn.cursor()
+    c.execute("SELECT EXISTS (SELECT 1 FROM astronaut_stats);")
+    if c.fetchone()[0]:
+        return
+    totals, skills = compute_astronaut_stats(c)
+    c.execute("INSERT INTO astronaut_stats (id, astronauts, active, hoursInSpace) VALUES (1, ?, ?, ?);", totals)
+    c.execute("DELETE FROM skill_stats;")
+    c.executemany("INSERT INTO skill_stats (skill, astronauts) VALUES (?, ?);", skills)
+
+def convert_active_flags(conn):
+    """ migration: stores the 'True'/'False' text of rows written before
+        active became 0/1 as integers, then recounts astronaut_stats, whose
+        totals counted every such row as active
+    """
     c = conn.cursor()
+    c.execute("UPDATE astronauts SET active = (active = 'True') WHERE typeof(active) = 'text';")
+    totals, _ = compute_astronaut_stats(c)
+    c.execute("INSERT OR REPLACE INTO astronaut_stats (id, astronauts, active, hoursInSpace) VALUES (1, ?, ?, ?);",
+              totals)
 
-    query = ''
-    if filters:
-        query = build_filters(filters)
-
-    c.execute(f"SELECT * FROM astronauts {query};")
-    rows = c.fetchall()
-    astronauts = []
-    for row in rows:
-        tmp_astronaut = OrderedDict()
-        tmp_astronaut["id"] = row[0]
-        tmp_astronaut["active"] = bool(row[1])
-        tmp_astronaut["firstName"] = row[2]
-        tmp_astronaut["lastName"] = row[3]
-        tmp_astronaut["skills"] = row[4].split(",")
-        tmp_astronaut["hoursInSpace"] = int(row[5])
-        tmp_astronaut["picture"] = row[6]
-        astronauts.append(tmp_astronaut)
-    
-    conn.close()
-    return astronauts
+def add_astronauts_bulk(astronauts):
+    query = statements.get(('insert', 'astronauts'), lambda: (
+        f"INSERT INTO astronauts ({', '.join(ASTRONAUT_COLUMNS)}) "
+        f"VALUES ({', '.join('?' for _ in ASTRONAUT_COLUMNS)});"))
+    with timed('add_astronauts_bulk', query), writer.connection() as conn:
+        with closing(conn.cursor()) as c:
+            for astronaut in astronauts:
+                try:
+                    c.execute(query, astronaut_values(astronaut))
+                except sqlite3.IntegrityError as ex:
+                    LOG.error(ex)
+                    raise Exception(f"{ex} when processing: {astronaut['firstName']} {astronaut['lastName']}")
+            replace_astronaut_skills(c, ((a["id"], a["skills"]) for a in astronauts))
+    # Drops cached "not found" lookups of the new ids as well.
+    invalidate_astronauts(astronaut["id"] for astronaut in astronauts)
+
+def insert_astronauts_batch(astronauts):
+    """ inserts astronauts with one executemany in a single transaction,
+        falling back to row by row to find the rows that conflict
+    :param astronauts: list of astronauts
+    :return: list of (position, error) for the rows that were not inserted
+    """
+    query = statements.get(('insert', 'astronauts'), lambda: (
+        f"INSERT INTO astronauts ({', '.join(ASTRONAUT_COLUMNS)}) "
+        f"VALUES ({', '.join('?' for _ in ASTRONAUT_COLUMNS)});"))
+    values = [astronaut_values(astronaut) for astronaut in astronauts]
+    errors = []
+    with timed('insert_astronauts_batch', query), writer.connection() as conn:
+        with closing(conn.cursor()) as c:
+            try:
+                c.executemany(query, values)
+            except sqlite3.IntegrityError:
+                conn.rollback()
+                for position, row in enumerate(values):
+                    try:
+                        c.execute(query, row)
+                    except sqlite3.IntegrityError as ex:
+                        errors.append((position, str(ex)))
+            failed = {position for position, _ in errors}
+            replace_astronaut_skills(c, (
+                (a["id"], a["skills"]) for position, a in enumerate(astronauts) if position not in failed))
+    invalidate_astronauts(astronaut["id"] for astronaut in astronauts)
+    return errors
+
+def filter_value(key, value):
+    # 'active' is stored as 0/1 but arrives from the query string as text.
+    if key == 'active' and isinstance(value, str):
+        return {'true': 1, '1': 1, 'false': 0, '0': 0}.get(value.lower(), value)
+    return value
+
+def parse_sort(sort=None):
+    """ :param sort: a column of SORT_FIELDS, '-' prefixed for descending order
+    :return: (column, descending)
+    """
+    sort = sort or 'id_'
+    descending = sort.startswith('-')
+    field = sort[1:] if descending else sort
+    if field not in SORT_FIELDS:
+        raise ValueError(f"Invalid sort: {sort}, choices are {', '.join(SORT_FIELDS)}")
+    return field, descending
+
+def sort_columns(sort=None):
+    """ the columns a listing is ordered by, which are also the cursor values """
+    field, _ = parse_sort(sort)
+    return ('id_', ) if field == 'id_' else (field, 'id_')
+
+def build_filters(filters, after=None, sort=None):
+    """ builds the WHERE clause for the given filters
+    :param filters: dict of field -> value, unknown fields are ignored;
+        'skill' takes a skill, a comma separated string or a list, matched through astronaut_skills
+        with AND semantics, or OR when 'skill_match' is 'any';
+        'column[op]' compares a RANGE_FIELDS column with a RANGE_OPERATORS operator
+    :param after: sort_columns values of the last row of the previous page (keyset)
+    :param sort: see parse_sort
+    :return: (query, params) with one placeholder per value
+    """
+    valid_filters = ['id_', 'active', 'firstName', 'lastName']
+    keys = tuple(k for k in valid_filters if k in filters)
+    params = tuple(filter_value(k, filters[k]) for k in keys)
+
+    ranges = tuple((field, op) for field in RANGE_FIELDS for op in RANGE_OPERATORS
+                   if f'{field}[{op}]' in filters)
+    for field, op in ranges:
+        try:
+            params += (int(filters[f'{field}[{op}]']), )
+        except (TypeError, ValueError):
+            raise ValueError(f"'{field}[{op}]' needs to be an integer")
+
+    skills = filters.get('skill') or ()
+    if isinstance(skills, str):
+        skills = skills.split(",")
+    skills = tuple(sorted({skill for skill in skills if skill}))
+    if len(skills) > MAX_SKILL_FILTERS:
+        raise ValueError(f"'skill' takes at most {MAX_SKILL_FILTERS} skills")
+    match_all = filters.get('skill_match', 'all') != 'any'
+    # Repeating the last skill doesn't change what IN matches.
+    slots = 1 << (len(skills) - 1).bit_length() if skills else 0
+    params += skills + skills[-1:] * (slots - len(skills))
+    if skills and match_all:
+        params += (len(skills), )
+
+    columns = sort_columns(sort)
+    _, descending = parse_sort(sort)
+    keyset = after is not None
+    if keyset:
+        after = tuple(after) if isinstance(after, (list, tuple)) else (after, )
+        if len(after) != len(columns):
+            raise ValueError(f"Invalid cursor for sort {sort}")
+        params += after
+
+    def build():
+        conditions = [f'{k} = ?' for k in keys]
+        conditions += [f'{field} {RANGE_OPERATORS[op]} ?' for field, op in ranges]
+        if skills:
+            placeholders = ', '.join('?' for _ in range(slots))
+            conditions.append(
+                f"id_ IN (SELECT astronaut_id FROM astronaut_skills WHERE skill IN ({placeholders})"
+                + (" GROUP BY astronaut_id HAVING COUNT(*) = ?)" if match_all else ")"))
+        if keyset:
+            operator = '<' if descending else '>'
+            if len(columns) == 1:
+                conditions.append(f'{columns[0]} {operator} ?')
+            else:
+                conditions.append(f"({', '.join(columns)}) {operator} ({', '.join('?' for _ in columns)})")
+        return f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    shape = ('where', keys, ranges, slots, match_all, keyset and (columns, descending))
+    return statements.get(shape, build), params
+
+def build_order(sort=None):
+    """ ORDER BY clause for parse_sort(sort) """
+    _, descending = parse_sort(sort)
+    direction = ' DESC' if descending else ''
+    return f"ORDER BY {', '.join(c + direction for c in sort_columns(sort))}"
+
+def make_astronaut(row):
+    tmp_astronaut = OrderedDict()
+    tmp_astronaut["id"] = row[0]
+    tmp_astronaut["active"] = bool(row[1])
+    tmp_astronaut["firstName"] = row[2]
+    tmp_astronaut["lastName"] = row[3]
+    tmp_astronaut["skills"] = row[4].split(",")
+    tmp_astronaut["hoursInSpace"] = int(row[5])
+    tmp_astronaut["picture"] = row[6]
+    return tmp_astronaut
+
+def fetch_astronauts(filters=None, limit=None, after=None, sort=None):
+    """ fetches astronauts matching `filters`
+    :param limit: page size; when given rows are ordered by `sort`
+    :param after: sort_columns values (or the id_) of the last row of the previous page
+    :param sort: see parse_sort, defaults to id_
+    :return: list of astronauts
+    """
+    where, params = build_filters(filters or {}, after=after, sort=sort)
+    paged = limit is not None
+    order = build_order(sort) if paged or sort else ""
+    if paged:
+        params += (limit, )
+    query = statements.get(('select', where, order, paged), lambda: (
+        f"SELECT {', '.join(ASTRONAUT_COLUMNS)} FROM astronauts {where}"
+        + (f" {order}" if order else "") + (" LIMIT ?;" if paged else ";")))
+
+    sync_astronaut_caches()
+    if list(filters or {}) == ['id_'] and not paged:
+        cache, key = astronaut_cache, params[0]
+    else:
+        cache, key = listing_cache, (query, params)
+    generation = cache.generation
+    rows = cache.get(key)
+    if rows is None:
+        with timed('fetch_astronauts', query), readers.connection() as conn:
+            with closing(conn.cursor()) as c:
+                c.execute(query, params)
+                rows = tuple(c.fetchall())
+        cache.set(key, rows, generation=generation)
+    return [make_astronaut(row) for row in rows]
+
+def fetch_astronauts_by_ids(ids):
+    """ looks up many astronauts at once, through the cache of single lookups
+        (fetch_astronauts({'id_': ...})); the ids it misses are read with
+        `id_ IN (...)` queries of at most MAX_VARIABLES ids
+    :param ids: iterable of ids, repeated ones are looked up once
+    :return: (astronauts in the order of `ids`, ids that don't exist)
+    """
+    ids = list(OrderedDict.fromkeys(ids))
+    sync_astronaut_caches()
+    generation = astronaut_cache.generation
+    found = {}
+    misses = []
+    for id_ in ids:
+        rows = astronaut_cache.get(id_)
+        if rows is None:
+            misses.append(id_)
+        elif rows:
+            found[id_] = rows[0]
+    for start in range(0, len(misses), MAX_VARIABLES):
+        chunk = misses[start:start + MAX_VARIABLES]
+        # Padded to a power of two (repeating the last id) so a handful of
+        # statement shapes cover every chunk size.
+        size = min(MAX_VARIABLES, 1 << (len(chunk) - 1).bit_length())
+        query = statements.get(('select', 'ids', size), lambda: (
+            f"SELECT {', '.join(ASTRONAUT_COLUMNS)} FROM astronauts "
+            f"WHERE id_ IN ({', '.join('?' for _ in range(size))});"))
+        with timed('fetch_astronauts_by_ids', query), readers.connection() as conn:
+            with closing(conn.cursor()) as c:
+                c.execute(query, tuple(chunk) + (chunk[-1], ) * (size - len(chunk)))
+                rows = {row[0]: row for row in c.fetchall()}
+        for id_ in chunk:
+            # Cached like single lookups, "not found" included.
+            astronaut_cache.set(id_, (rows[id_], ) if id_ in rows else (), generation=generation)
+        found.update(rows)
+    astronauts = [make_astronaut(found[id_]) for id_ in ids if id_ in found]
+    return astronauts, [id_ for id_ in ids if id_ not in found]
+
+def match_expression(text):
+    """ turns free text into an FTS5 query where every word has to match the
+        start of a name token, e.g. 'neil arm' -> '"neil"* "arm"*'
+    """
+    return ' '.join(f'"{word}"*' for word in re.findall(r'\w+', text))
+
+def search_astronauts(text, filters=None, limit=100):
+    """ searches astronaut names, best matches (bm25) first
+    :param text: free text, see match_expression
+    :param filters: same as fetch_astronauts, applied to the matches
+    :param limit: maximum number of astronauts returned
+    :return: list of astronauts
+    """
+    match = match_expression(text)
+    if not match:
+        return []
+    where, params = build_filters(filters or {})
+    params = (match, ) + params + (limit, )
+    query = statements.get(('search', where), lambda: (
+        f"SELECT {', '.join(ASTRONAUT_COLUMNS)} FROM "
+        "(SELECT rowid AS hit, rank FROM astronauts_fts WHERE astronauts_fts MATCH ?) AS search "
+        f"JOIN astronauts ON astronauts.rowid = search.hit {where} "
+        "ORDER BY search.rank, id_ LIMIT ?;"))
+
+    sync_astronaut_caches()
+    key = (query, params)
+    generation = listing_cache.generation
+    rows = listing_cache.get(key)
+    if rows is None:
+        with timed('search_astronauts', query), readers.connection() as conn:
+            with closing(conn.cursor()) as c:
+                c.execute(query, params)
+                rows = tuple(c.fetchall())
+        listing_cache.set(key, rows, generation=generation)
+    return [make_astronaut(row) for row in rows]
+
+def make_astronaut_stats(totals, skills):
+    count, active, hours = totals
+    return OrderedDict([
+        ("count", count),
+        ("active", active),
+        ("hoursInSpace", OrderedDict([
+            ("total", hours),
+            ("average", round(hours / count, 2) if count else 0),
+        ])),
+        ("skills", OrderedDict(skills)),
+    ])
+
+def fetch_astronaut_stats():
+    """ reads the totals kept by the astronaut_stats/skill_stats triggers
+    :return: dict with count, active, hoursInSpace total/average and the
+        number of astronauts per skill
+    """
+    sync_astronaut_caches()
+    generation = listing_cache.generation
+    stats = listing_cache.get('stats')
+    if stats is None:
+        query = "SELECT astronauts, active, hoursInSpace FROM astronaut_stats WHERE id = 1;"
+        with timed('fetch_astronaut_stats', query), readers.connection() as conn:
+            with closing(conn.cursor()) as c:
+                c.execute(query)
+                totals = c.fetchone() or (0, 0, 0)
+                c.execute("SELECT skill, astronauts FROM skill_stats ORDER BY skill;")
+                stats = (totals, tuple(c.fetchall()))
+        listing_cache.set('stats', stats, generation=generation)
+    return make_astronaut_stats(*stats)
+
+def check_astronaut_stats():
+    """ compares the maintained totals with a full recomputation
+    :return: (maintained, recomputed), both as returned by fetch_astronaut_stats
+    """
+    with readers.connection() as conn:
+        with closing(conn.cursor()) as c:
+            # One read transaction so both sides see the same snapshot.
+            c.execute("BEGIN;")
+            try:
+                c.execute("SELECT astronauts, active, hoursInSpace FROM astronaut_stats WHERE id = 1;")
+                totals = c.fetchone() or (0, 0, 0)
+                c.execute("SELECT skill, astronauts FROM skill_stats ORDER BY skill;")
+                maintained = make_astronaut_stats(totals, c.fetchall())
+                recomputed = make_astronaut_stats(*compute_astronaut_stats(c))
+            finally:
+                c.execute("COMMIT;")
+    return maintained, recomputed
+
+def iter_astronaut_rows(filters=None, chunk_size=500):
+    """ streams raw astronaut rows matching `filters` straight from the cursor
+    :return: generator of lists of at most `chunk_size` row tuples, in
+        ASTRONAUT_COLUMNS order; its connection is held until the generator
+        is exhausted or closed
+    """
+    where, params = build_filters(filters or {})
+    query = statements.get(('select', where, "", False), lambda: (
+        f"SELECT {', '.join(ASTRONAUT_COLUMNS)} FROM astronauts {where};"))
+
+    # Not a pooled reader: slow clients downloading exports would hold every
+    # one of them and leave the other requests waiting for a connection.
+    with readers.detached() as conn:
+        with closing(conn.cursor()) as c:
+            # Only the first step is timed, the rows are read as they are streamed.
+            with timed('iter_astronaut_rows', query):
+                c.execute(query, params)
+            while True:
+                rows = c.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield rows
+
+def iter_astronauts(filters=None, chunk_size=500):
+    """ like iter_astronaut_rows, yielding lists of astronauts """
+    with closing(iter_astronaut_rows(filters, chunk_size)) as chunks:
+        for rows in chunks:
+            yield [make_astronaut(row) for row in rows]
+
+def explain_query_plans():
+    """ runs EXPLAIN QUERY PLAN for every statement the data layer has issued
+    :return: dict of query -> list of plan steps
+    """
+    plans = {}
+    with readers.connection() as conn:
+        for query in statements.statements().values():
+            if not query.startswith(('SELECT', 'UPDATE', 'DELETE')):
+                continue
+            with closing(conn.cursor()) as c:
+                c.execute(f"EXPLAIN QUERY PLAN {query}", (None, ) * query.count('?'))
+                plans[query] = [row[-1] for row in c.fetchall()]
+    return plans
 
 def build_patch_query(id_, filters):
+    """ builds the UPDATE statement for the given astronaut fields
+    :return: (query, params), query is empty when there is nothing to update
+    """
     astronaut_fields = ["active", "firstName", "skills", "lastName", "hoursInSpace", "picture"]
-    query = ""
-    for k,v in filters.items():
-        if k in astronaut_fields:
-            if k == 'skills':
-                skills = ",".join(v)
-                query += f"{k} = '{skills}', "
-            else:
-                query += f"{k} = '{v}', "
-    if query:
-        query = f"UPDATE astronauts SET {query.rsplit(', ', 1)[0]} WHERE id_ = '{id_}';" 
-    return query
+    keys = tuple(k for k in astronaut_fields if k in filters)
+    if not keys:
+        return "", ()
+    query = statements.get(('update', keys), lambda: (
+        f"UPDATE astronauts SET {', '.join(f'{k} = ?' for k in keys)} WHERE id_ = ?;"))
+    params = tuple(",".join(filters[k]) if k == 'skills' else filters[k] for k in keys)
+    return query, params + (id_, )
 
 def update_astronaut_info(id_, fields=None):
-    conn = create_connection(DATABASE)
-    c = conn.cursor()
-    c.execute(build_patch_query(id_, fields))
-    conn.commit()
-    conn.close()
+    query, params = build_patch_query(id_, fields or {})
+    if query:
+        def update(conn):
+            with closing(conn.cursor()) as c:
+                c.execute(query, params)
+                if 'skills' in fields:
+                    replace_astronaut_skills(c, [(id_, fields['skills'])])
+
+        with timed('update_astronaut_info', query):
+            writes.run(update)
+        invalidate_astronauts([id_])
     astronaut = fetch_astronauts({'id_': id_})[0]
     return astronaut
     
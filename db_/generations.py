@@ -0,0 +1,50 @@
+import mmap
+import os
+import struct
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: bumps are only serialized between the threads of a process.
+    fcntl = None
+
+class SharedGenerations(object):
+    """ per-table write counters in a small memory-mapped file next to the
+        database, shared by every worker process on the host
+    :param path: file holding the counters, created when missing
+    :param tables: table names, each one gets an 8 byte slot
+    """
+    SLOT = struct.Struct('<Q')
+
+    def __init__(self, path, tables):
+        self.path = path
+        self.slots = {table: i * self.SLOT.size for i, table in enumerate(tables)}
+        size = self.SLOT.size * len(self.slots)
+        self._lock = threading.Lock()
+        # Kept open for the record locks taken by bump.
+        self._file = open(path, 'a+b')
+        if os.fstat(self._file.fileno()).st_size < size:
+            self._file.truncate(size)
+        self._map = mmap.mmap(self._file.fileno(), size)
+
+    def get(self, table):
+        return self.SLOT.unpack_from(self._map, self.slots[table])[0]
+
+    def bump(self, table):
+        """ marks `table` as written; call after the write has committed.
+            The increment holds a lock on the slot, shared with the other
+            workers, so concurrent bumps never store an older value (the
+            counter is part of the ETags, it must never go back).
+        """
+        offset = self.slots[table]
+        with self._lock:
+            if fcntl is not None:
+                fcntl.lockf(self._file, fcntl.LOCK_EX, self.SLOT.size, offset)
+            try:
+                value = (self.get(table) + 1) % (1 << 64)
+                self.SLOT.pack_into(self._map, offset, value)
+            finally:
+                if fcntl is not None:
+                    fcntl.lockf(self._file, fcntl.LOCK_UN, self.SLOT.size, offset)
+        return value
@@ -0,0 +1,122 @@
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager, suppress
+
+from conf.config import LOG
+
+class ConnectionPool(object):
+    """ keeps warm database connections for the current worker process
+        and hands them out one at a time with `connection()`
+    :param connect: callable returning a new Connection object
+    :param size: maximum number of connections opened by this pool
+    :param timeout: seconds to wait for a free connection
+    :param pragmas: PRAGMAs applied once to every new connection
+    """
+    def __init__(self, connect, size=8, timeout=30.0, pragmas=None):
+        self.connect = connect
+        self.size = size
+        self.timeout = timeout
+        self.pragmas = pragmas or {}
+        self._reset()
+
+    def _reset(self):
+        # Connections must never be shared with a forked child (gunicorn
+        # workers), so everything is rebuilt the first time a new pid uses it.
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._idle = queue.LifoQueue()
+        self._local = threading.local()
+        self._opened = 0
+        self._checkouts = 0
+        self._wait_time = 0.0
+
+    def _open(self):
+        conn = self.connect()
+        for pragma, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {pragma} = {value};")
+        return conn
+
+    def _acquire(self):
+        with suppress(queue.Empty):
+            return self._idle.get_nowait()
+
+        with self._lock:
+            can_open = self._opened < self.size
+            if can_open:
+                self._opened += 1
+        if can_open:
+            try:
+                return self._open()
+            except Exception:
+                with self._lock:
+                    self._opened -= 1
+                raise
+
+        started = time.monotonic()
+        try:
+            conn = self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            message = f"No database connection available after {self.timeout}s"
+            LOG.error(message)
+            raise Exception(message)
+        finally:
+            with self._lock:
+                self._wait_time += time.monotonic() - started
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """ checks out a connection, commits on success and rolls back on
+            error; nested calls in the same thread reuse the same connection.
+            Close cursors inside the block (`closing(conn.cursor())`): one
+            collected after the connection went back to the pool resets its
+            statement while another thread may be using the connection.
+        """
+        if self._pid != os.getpid():
+            self._reset()
+
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            yield conn
+            return
+
+        conn = self._acquire()
+        with self._lock:
+            self._checkouts += 1
+        self._local.conn = conn
+        try:
+            with conn:
+                yield conn
+        finally:
+            self._local.conn = None
+            self._idle.put(conn)
+
+    @contextmanager
+    def detached(self):
+        """ a new connection set up like the pooled ones but not taken from
+            or returned to the pool, closed after the block; for reads that
+            last as long as a client takes to download them
+        """
+        conn = self._open()
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def held(self):
+        """ the connection the calling thread has checked out, or None """
+        if self._pid != os.getpid():
+            return None
+        return getattr(self._local, 'conn', None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': self.size,
+                'opened': self._opened,
+                'idle': self._idle.qsize(),
+                'checkouts': self._checkouts,
+                'wait_time': self._wait_time,
+            }
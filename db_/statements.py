@@ -0,0 +1,35 @@
+import threading
+
+class StatementCache(object):
+    """ builds the SQL text of a statement once per shape (e.g. the set of
+        filter keys) and hands the same text back afterwards; values are
+        always bound as parameters, so sqlite3's per-connection statement
+        cache compiles each shape only once
+    """
+    def __init__(self):
+        self._statements = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, shape, build):
+        """ returns the SQL for `shape`, calling `build()` the first time """
+        sql = self._statements.get(shape)
+        with self._lock:
+            if sql is None:
+                sql = self._statements.setdefault(shape, build())
+                self._misses += 1
+            else:
+                self._hits += 1
+        return sql
+
+    def statements(self):
+        return dict(self._statements)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'statements': len(self._statements),
+                'hits': self._hits,
+                'misses': self._misses,
+            }
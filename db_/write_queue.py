@@ -0,0 +1,135 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from conf.config import LOG
+
+class WriteQueue(object):
+    """ group commit: small writes from every thread of the worker are run by
+        one writer thread, which commits all the ones waiting in a single
+        transaction, so concurrent requests share one commit (and, with
+        synchronous=FULL, its fsync)
+    :param pool: ConnectionPool of the writer connection
+    :param window: seconds the writer waits after the first write of a
+        transaction for more to join it, when writes are coming in
+        concurrently (a lone write is committed straight away); 0 only
+        takes those already queued
+    :param size: maximum writes per transaction; 0 disables the queue and
+        every write commits on its own, in the calling thread
+
+    A write is a callable taking the connection. It runs inside a SAVEPOINT,
+    so one that raises is undone alone and its caller gets the exception
+    while the others commit. It must not commit or roll back itself.
+    """
+    def __init__(self, pool, window=0.002, size=256):
+        self.pool = pool
+        self.window = window
+        self.size = size
+        self._reset()
+
+    def _reset(self):
+        # Like the pool, a forked worker starts its own writer thread.
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._thread = None
+        self._transactions = 0
+        self._writes = 0
+        self._largest = 0
+        self._last = 1
+
+    def run(self, write):
+        """ runs `write(conn)` and returns its result once it is committed
+            (or raises what it raised, or the commit error); durable only as
+            far as the writer's `synchronous` pragma makes commits
+        """
+        conn = self.pool.held()
+        if conn is not None:
+            # Already inside a write transaction of this thread: waiting for
+            # the writer thread, which needs that connection, would deadlock.
+            return write(conn)
+        if not self.size:
+            with self.pool.connection() as conn:
+                return write(conn)
+        return self.submit(write).result()
+
+    def submit(self, write):
+        """ queues `write(conn)`
+        :return: Future, done once the transaction holding it has committed
+        """
+        if self._pid != os.getpid():
+            self._reset()
+        future = Future()
+        self._queue.put((write, future))
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._work, name='db-writer', daemon=True)
+                    self._thread.start()
+        return future
+
+    def _work(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                    continue
+                except queue.Empty:
+                    pass
+                timeout = deadline - time.monotonic()
+                # Waiting only pays off when other writers are around.
+                if timeout <= 0 or (len(batch) == 1 and self._last == 1):
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            self._last = len(batch)
+            try:
+                self._commit(batch)
+            except Exception as ex:
+                if len(batch) == 1:
+                    batch[0][1].set_exception(ex)
+                    continue
+                # Whatever broke the transaction, find out whose write it was.
+                LOG.error(f"Group commit of {len(batch)} writes failed, retrying them one by one: {ex}")
+                for item in batch:
+                    try:
+                        self._commit([item])
+                    except Exception as ex:
+                        item[1].set_exception(ex)
+
+    def _commit(self, batch):
+        results = []
+        with self.pool.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE;")
+            for write, _ in batch:
+                conn.execute("SAVEPOINT write;")
+                try:
+                    results.append((write(conn), None))
+                except Exception as ex:
+                    conn.execute("ROLLBACK TO write;")
+                    results.append((None, ex))
+                conn.execute("RELEASE write;")
+        with self._lock:
+            self._transactions += 1
+            self._writes += len(batch)
+            self._largest = max(self._largest, len(batch))
+        for (_, future), (result, error) in zip(batch, results):
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'queued': self._queue.qsize(),
+                'transactions': self._transactions,
+                'writes': self._writes,
+                'largest_transaction': self._largest,
+            }
@@ -2,12 +2,14 @@
 
 import falcon
 
-from api.common import base
+from api.common import base, metrics
 from api.v1 import astronauts, users
-from conf.config import APP_NAME, LOG
+from conf.config import APP_NAME, LOG, ASGI_THREADS, ASGI_SPOOL_SIZE, METRICS_ENABLED
 from db_ import init_session
-from middleware import ConvertToJson, RequireJSON
+from middleware import ConditionalRequests, ConvertToJson, JSONRequest, RequestMetrics, RequireJSON
+from utils.asgi import WSGIToASGI
 from utils.errors import generic_path_error_handler
+from utils.hashing_tools import shutdown_pool
 
 class App(falcon.API):
     def __init__(self, *args, **kwargs):
@@ -24,8 +26,15 @@ class App(falcon.API):
         
         # Astronauts
         self.add_route('/api/astronauts', astronauts.List())
+        self.add_route('/api/astronauts/batch', astronauts.Batch())
+        self.add_route('/api/astronauts/export', astronauts.Export())
+        self.add_route('/api/astronauts/lookup', astronauts.Lookup())
+        self.add_route('/api/astronauts/stats', astronauts.Stats())
         self.add_route('/api/astronauts/{id_}', astronauts.Detail())
 
+        if METRICS_ENABLED:
+            self.add_route('/metrics', metrics.Metrics())
+
         # This catches none existing paths
         self.add_sink(generic_path_error_handler, '')
 
@@ -34,5 +43,12 @@ class App(falcon.API):
         self.req_options.strip_url_path_trailing_slash = True
 
 init_session()
-middleware = [ConvertToJson(help_messages=True), RequireJSON()]
-application = App(middleware=middleware)
+middleware = [ConvertToJson(help_messages=True), RequireJSON(), ConditionalRequests()]
+if METRICS_ENABLED:
+    # Outermost and innermost, see RequestMetrics.
+    request_metrics = RequestMetrics()
+    middleware = [request_metrics] + middleware + [request_metrics.responder]
+application = App(middleware=middleware, request_type=JSONRequest)
+# Same app for ASGI servers, e.g. `uvicorn main:asgi_application`.
+asgi_application = WSGIToASGI(application, threads=ASGI_THREADS, spool_size=ASGI_SPOOL_SIZE,
+                              on_shutdown=[shutdown_pool])
@@ -1,4 +1,6 @@
 # -*- coding: utf-8 -*-
 
-from .convert_to_json import ConvertToJson
+from .conditional_requests import ConditionalRequests
+from .convert_to_json import ConvertToJson, JSONRequest
+from .request_metrics import RequestMetrics
 from .require_json import RequireJSON
@@ -0,0 +1,61 @@
+import hashlib
+
+import falcon
+
+from db_ import database as db
+from middleware.jwt_authentication import validate_token
+from utils.errors import generic_error_handler
+
+class ConditionalRequests(object):
+    """ETags and conditional requests for resources with an `etag_table`.
+
+    The ETag is derived from the table's write counter and the request URI,
+    so it changes with every committed write. `If-None-Match` on GET answers
+    304 before the resource runs (no query, no serialization) and `If-Match`
+    on PATCH/DELETE answers 412 when the client's copy is out of date.
+    """
+
+    def make_etag(self, table, path, query_string=''):
+        version = db.generations.get(table)
+        digest = hashlib.blake2b(f'{path}?{query_string}'.encode('utf-8'), digest_size=8).hexdigest()
+        return f'{version:x}-{digest}'
+
+    def process_resource(self, req, resp, resource, params):
+        table = getattr(resource, 'etag_table', None)
+        if table is None:
+            return
+
+        if req.method in ('GET', 'HEAD'):
+            etag = self.make_etag(table, req.path, req.query_string)
+            req.context.etag = etag
+            if_none_match = req.if_none_match or []
+            if '*' in if_none_match or etag in if_none_match:
+                # Only clients allowed to read the resource learn it is unchanged.
+                validate_token(req, resp, resource, params)
+                resp.status = falcon.HTTP_304
+                resp.etag = etag
+                resp.complete = True
+
+        elif req.method in ('PATCH', 'PUT', 'DELETE') and req.if_match:
+            etag = self.make_etag(table, req.path)
+            matches = [
+                tag for tag in req.if_match
+                if tag == '*' or (tag == etag and not tag.is_weak)]
+            if not matches:
+                validate_token(req, resp, resource, params)
+                error = {
+                    'title': 'precondition failed',
+                    'description': 'The resource has changed since it was fetched',
+                    'details': f"Current ETag is '\"{etag}\"'"
+                }
+                raise generic_error_handler(412, req=req, error_override=error)
+
+    def process_response(self, req, resp, resource, req_succeeded):
+        if not req_succeeded or resp.status != falcon.HTTP_200:
+            return
+        etag = getattr(req.context, 'etag', None)
+        if etag is None and req.method == 'PATCH' and getattr(resource, 'etag_table', None):
+            # Lets the client send its next If-Match without a GET in between.
+            etag = self.make_etag(resource.etag_table, req.path)
+        if etag:
+            resp.etag = etag
@@ -1,21 +1,140 @@
 # Standard python libraries
 import uuid
-from datetime import datetime
-import json
 import re
 import cgi
 from io import BytesIO
 # Third party libraries: requirements.txt
+import falcon
 import six
 
 # Resources created in other modules of app.
 from utils.errors import generic_error_handler
+from utils.json_codec import dumps, loads
+from utils.metrics import SERIALIZATION, clock, metrics
+
+# TODO replace this with https://github.com/Julian/jsonschema
+def validate(field, value, dtype=None, default=None, min=None, max=None, match=None, choices=None, valid_uuid=None):
+    """JSON field validators:
+
+    dtype      data type
+    default    value used if field is not provided in the request body
+    min        minimum length (str) or value (int, float)
+    max        maximum length (str) or value (int, float)
+    match      regular expression
+    choices    list to which the value should be limited
+    """
+    err_title = "Validation error"
+
+    if dtype:
+        if type(value) is not dtype:
+            error = {
+                "title": err_title,
+                "description": f"Data type for '{field}' is '{type(value).__name__}' but should be '{dtype.__name__}'"}
+            raise generic_error_handler(400, error_override=error)
 
-class DateTimeEncoder(json.JSONEncoder):
-    def default(self, o):
-        if isinstance(o, datetime):
-            return o.isoformat()
-        return json.JSONEncoder.default(self, o)
+    if type(value) in six.string_types:
+        if min and len(value) < min:
+            error = {
+                "title": err_title,
+                "description": f"Minimum length for '{field}' is '{min}'"}
+            raise generic_error_handler(400, error_override=error)
+
+        if max and len(value) > max:
+            error = {
+                "title": err_title,
+                "description": f"Maximum length for '{field}' is '{max}'"}
+            raise generic_error_handler(400, error_override=error)
+
+    elif type(value) in (int, float):
+        if min and value < min:
+            error = {
+                "title": err_title,
+                "description": f"Minimum length for '{field}' is '{min}'"}
+            raise generic_error_handler(400, error_override=error)
+
+        if max and value > max:
+            error = {
+                "title": err_title,
+                "description": f"Maximum length for '{field}' is '{max}'"}
+            raise generic_error_handler(400, error_override=error)
+
+    if match and not re.match(match, re.escape(value)):
+        error = {
+            "title": err_title,
+            "description": f"'{field}' does not match Regex: {match}"}
+        raise generic_error_handler(400, error_override=error)
+
+    if valid_uuid:
+            try:
+                uuid.UUID(value).hex
+            except ValueError:
+                error = {
+                    "title": err_title,
+                    "description": f"'{field}' is Not a valid UUID: {value}"}
+                raise generic_error_handler(400, error_override=error)
+
+    if choices and value not in choices:
+        error = {
+            "title": err_title,
+            "description": f"{field} must be one of {choices}"}
+        raise generic_error_handler(400, error_override=error)
+
+    return value
+
+class JSONRequest(falcon.Request):
+    """Request whose JSON body is parsed on first use and kept on the request
+    itself, so concurrent requests in threaded workers never see each
+    other's payload. Pass it to the app as `request_type`."""
+    _NO_JSON = object()
+
+    def __init__(self, env, options=None):
+        super(JSONRequest, self).__init__(env, options)
+        self._json = self._NO_JSON
+
+    @property
+    def json(self):
+        """The decoded `application/json` body, `{}` for any other request"""
+        if self._json is self._NO_JSON:
+            self._json = {}
+            if self.content_length and 'application/json' in (self.content_type or ''):
+                body = self.bounded_stream.read()
+                try:
+                    self._json = loads(body.decode('utf-8'))
+                except UnicodeDecodeError:
+                    error = {
+                        "description": "Invalid encoding",
+                        "details": "Could not decode as UTF-8"}
+                    raise generic_error_handler(400, error_override=error)
+                except ValueError:
+                    error = {
+                        "description": "Malformed JSON",
+                        "details": "Syntax error"
+                    }
+                    raise generic_error_handler(400, error_override=error)
+        return self._json
+
+    def check_json(self, field):
+        return True if field in self.json else False
+
+    def get_json(self, field, **kwargs):
+        """Helper to access JSON fields in the request body
+
+        Optional built-in validators.
+        """
+        value = None
+        if field in self.json:
+            value = self.json[field]
+            kwargs.pop('default', None)
+        elif 'default' not in kwargs:
+            error = {
+                'description': 'Missing JSON field',
+                'details': f"Field '{field}' is required"}
+            raise generic_error_handler(400, error_override=error)
+        else:
+            value = kwargs.pop('default')
+
+        validators = kwargs
+        return validate(field, value, **validators)
 
 class ConvertToJson(object):
     def __init__(self, help_messages=True):
@@ -45,102 +164,9 @@ class ConvertToJson(object):
         # FieldStorage instance).
         return field.value
 
-    def check_json(self, field):
-        return True if field in self.req.json else False
-
-    def get_json(self, field, **kwargs):
-        """Helper to access JSON fields in the request body
-
-        Optional built-in validators.
-        """
-        value = None
-        if field in self.req.json:
-            value = self.req.json[field]
-            kwargs.pop('default', None)
-        elif 'default' not in kwargs:
-            error = {
-                'description': 'Missing JSON field',
-                'details': f"Field '{field}' is required"}
-            raise generic_error_handler(400, error_override=error)
-        else:
-            value = kwargs.pop('default')
-
-        validators = kwargs
-        return self.validate(field, value, **validators)
-
-    # TODO replace this with https://github.com/Julian/jsonschema
-    def validate(self, field, value, dtype=None, default=None, min=None, max=None, match=None, choices=None, valid_uuid=None):
-        """JSON field validators:
-
-        dtype      data type
-        default    value used if field is not provided in the request body
-        min        minimum length (str) or value (int, float)
-        max        maximum length (str) or value (int, float)
-        match      regular expression
-        choices    list to which the value should be limited
-        """
-        err_title = "Validation error"
-
-        if dtype:
-            if type(value) is not dtype:
-                error = {
-                    "title": err_title,
-                    "description": f"Data type for '{field}' is '{type(value).__name__}' but should be '{dtype.__name__}'"}
-                raise generic_error_handler(400, error_override=error)
-
-        if type(value) in six.string_types:
-            if min and len(value) < min:
-                error = {
-                    "title": err_title,
-                    "description": f"Minimum length for '{field}' is '{min}'"}
-                raise generic_error_handler(400, error_override=error)
-
-            if max and len(value) > max:
-                error = {
-                    "title": err_title,
-                    "description": f"Maximum length for '{field}' is '{max}'"}
-                raise generic_error_handler(400, error_override=error)
-
-        elif type(value) in (int, float):
-            if min and value < min:
-                error = {
-                    "title": err_title,
-                    "description": f"Minimum length for '{field}' is '{min}'"}
-                raise generic_error_handler(400, error_override=error)
-
-            if max and value > max:
-                error = {
-                    "title": err_title,
-                    "description": f"Maximum length for '{field}' is '{max}'"}
-                raise generic_error_handler(400, error_override=error)
-
-        if match and not re.match(match, re.escape(value)):
-            error = {
-                "title": err_title,
-                "description": f"'{field}' does not match Regex: {match}"}
-            raise generic_error_handler(400, error_override=error)
-
-        if valid_uuid:
-                try:
-                    uuid.UUID(value).hex
-                except ValueError:
-                    error = {
-                        "title": err_title,
-                        "description": f"'{field}' is Not a valid UUID: {value}"}
-                    raise generic_error_handler(400, error_override=error)
-
-        if choices and value not in choices:
-            error = {
-                "title": err_title,
-                "description": f"{field} must be one of {choices}"}
-            raise generic_error_handler(400, error_override=error)
-
-        return value
-
     def process_request(self, req, resp):
         """Middleware request"""
         if not req.content_length:
-            req.get_json_flag = False
             if req.method in ['POST', 'PUT', 'PATCH']:
                 # body = '{}'.encode('utf-8')
                 error = {
@@ -152,26 +178,8 @@ class ConvertToJson(object):
                 return
 
         if 'application/json' in req.content_type:
-            body = req.stream.read()
-            req.json = {}
-            self.req = req
-            req.get_json_flag = True
-            req.get_json = self.get_json  # helper function
-            req.check_json = self.check_json  # helper function
-
-            try:
-                req.json = json.loads(body.decode('utf-8'))
-            except UnicodeDecodeError:
-                error = {
-                    "description": "Invalid encoding",
-                    "details": "Could not decode as UTF-8"}
-                raise generic_error_handler(400, error_override=error)
-            except ValueError:
-                error = {
-                    "description": "Malformed JSON",
-                    "details": "Syntax error"
-                }
-                raise generic_error_handler(400, error_override=error)
+            # Parsed by JSONRequest.json when the resource first reads it.
+            return
 
         elif "multipart/form-data" in req.content_type:
             # Multipart
@@ -200,4 +208,6 @@ class ConvertToJson(object):
     def process_response(self, req, resp, resource, req_succeeded):
         """Middleware response"""
         if getattr(resp, "json", None) is not None:
-            resp.body = str.encode(json.dumps(resp.json, cls=DateTimeEncoder))
+            started = clock()
+            resp.body = dumps(resp.json)
+            metrics.add_phase(SERIALIZATION, clock() - started)
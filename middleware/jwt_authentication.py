@@ -1,9 +1,27 @@
+import hashlib
+import time
+
 import jwt
 
-from conf.config import LOG, API_SECRET_KEY
+from conf.config import LOG, API_SECRET_KEY, JWT_CACHE_SIZE, JWT_EXPIRATION_SECONDS
+from utils.cache import LRUCache
 from utils.errors import generic_error_handler
+from utils.metrics import JWT, clock, metrics
+
+# Claims of tokens that already passed verification, keyed by token digest.
+verified_tokens = LRUCache(JWT_CACHE_SIZE)
+
+metrics.collector('jwt_cache_stats', 'Verified token cache counters.', ['stat'],
+                  lambda: {(stat, ): value for stat, value in verified_tokens.stats().items()})
 
 def validate_token(req, resp, resource, params):
+    started = clock()
+    try:
+        check_token(req)
+    finally:
+        metrics.add_phase(JWT, clock() - started)
+
+def check_token(req):
     LOG.debug('JWT Validation')
     token = req.get_header('Authorization')
 
@@ -32,10 +50,20 @@ def token_is_valid(req, token):
     req.jwt_token = token
     token = token.split(f"{token_type} ")[1]
 
-    try:
-        jwt_body = jwt.decode(token, API_SECRET_KEY, verify=True, algorithms=['HS256'])
-        if 'username' in jwt_body:
-            req.username = jwt_body['username']
-    except Exception as ex:
-        LOG.error(f"There was an error : {ex}")
-        raise Exception(f"{ex}")
+    key = hashlib.sha256(token.encode('utf-8')).digest()
+    jwt_body = verified_tokens.get(key)
+    if jwt_body is None:
+        try:
+            jwt_body = jwt.decode(token, API_SECRET_KEY, verify=True, algorithms=['HS256'])
+        except Exception as ex:
+            LOG.error(f"There was an error : {ex}")
+            raise Exception(f"{ex}")
+        # Never keep a token past its own expiry.
+        ttl = JWT_EXPIRATION_SECONDS
+        if 'exp' in jwt_body:
+            ttl = min(ttl, jwt_body['exp'] - time.time())
+        if ttl > 0:
+            verified_tokens.set(key, jwt_body, ttl=ttl)
+
+    if 'username' in jwt_body:
+        req.username = jwt_body['username']
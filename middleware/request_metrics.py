@@ -0,0 +1,53 @@
+from utils.metrics import HANDLER, JWT, DB, MIDDLEWARE, SERIALIZATION, clock, metrics
+
+class RequestMetrics(object):
+    """Per-route latency histograms and per-phase timings.
+
+    Must be the first middleware, with `responder` the last one, e.g.
+    `[request_metrics, ..., request_metrics.responder]`: the first sees the
+    whole request, the last marks when the resource starts and ends. Time
+    outside the resource is `middleware`, minus the `serialization` of
+    `resp.json`; inside it `jwt` validation and `db` queries (reported by the
+    data layer) are split from the remaining `handler` time. Streamed bodies
+    are produced after the response is recorded and are not included.
+    """
+    def __init__(self, metrics=metrics):
+        self.metrics = metrics
+        self.responder = ResponderTimer(metrics)
+
+    def process_request(self, req, resp):
+        req.context.metrics_started = clock()
+        self.metrics.start_request()
+
+    def process_response(self, req, resp, resource, req_succeeded):
+        finished = clock()
+        phases = self.metrics.finish_request()
+        started = getattr(req.context, 'metrics_started', None)
+        if phases is None or started is None:
+            return
+        route = req.uri_template or 'unmatched'
+        total = finished - started
+        self.metrics.observe(('http_request_duration_seconds', req.method, route, resp.status[:3]), total)
+
+        # HANDLER holds the whole time spent in the resource so far.
+        responder = phases[HANDLER]
+        if responder:
+            phases[MIDDLEWARE] = total - responder - phases[SERIALIZATION]
+            phases[HANDLER] = responder - phases[JWT] - phases[DB]
+        else:
+            # Answered by a middleware (304, 4xx) before the resource ran.
+            phases[MIDDLEWARE] = total - phases[SERIALIZATION] - phases[JWT] - phases[DB]
+        self.metrics.accumulate(('http_request_phase_seconds', route), phases)
+
+class ResponderTimer(object):
+    """Innermost half of RequestMetrics, times the resource itself."""
+    def __init__(self, metrics=metrics):
+        self.metrics = metrics
+
+    def process_resource(self, req, resp, resource, params):
+        req.context.responder_started = clock()
+
+    def process_response(self, req, resp, resource, req_succeeded):
+        started = getattr(req.context, 'responder_started', None)
+        if started is not None:
+            self.metrics.add_phase(HANDLER, clock() - started)
@@ -3,10 +3,6 @@ from utils.errors import generic_error_handler
 class RequireJSON(object):
 
     def process_request(self, req, resp):
-        if not req.client_accepts_json:
-            error = {"description": "This API only supports responses encoded as JSON."}
-            raise generic_error_handler(400, req=req, error_override=error)
-
         if req.method not in ('OPTIONS') and req.method not in ('GET') and req.method not in ('DELETE'):
             if not req.content_type:
                 error = {
@@ -14,9 +10,18 @@ class RequireJSON(object):
                     "description": "Malformed JSON"}
                 raise generic_error_handler(415, req=req, error_override=error)
             elif "multipart/form-data" not in req.content_type:
-                if 'application/json' not in req.content_type:
+                if 'application/json' not in req.content_type and 'application/x-ndjson' not in req.content_type:
                     error = {
                         "title": "Unsupported media type",
                         "description": "Missing required header",
-                        "details": {"choices" :["multipart/form-data", "application/json"]}}
+                        "details": {"choices" :["multipart/form-data", "application/json", "application/x-ndjson"]}}
                     raise generic_error_handler(415, req=req, error_override=error)
+
+    def process_resource(self, req, resp, resource, params):
+        # Resources may list other media types they can respond with.
+        media_types = getattr(resource, 'media_types', None)
+        if media_types and req.client_prefers(media_types):
+            return
+        if not req.client_accepts_json:
+            error = {"description": "This API only supports responses encoded as JSON."}
+            raise generic_error_handler(400, req=req, error_override=error)
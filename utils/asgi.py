@@ -0,0 +1,162 @@
+import asyncio
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from conf.config import LOG
+
+class WSGIToASGI(object):
+    """Serves a WSGI application to an ASGI server.
+
+    The event loop accepts and parks connections and buffers request bodies
+    (in memory, or a temporary file past `spool_size` bytes). The
+    application runs on a pool of `threads` threads, one request per thread
+    from the first byte it reads to the last chunk it yields, so the
+    thread-local connection pools and streamed responses behave as they do
+    under a threaded WSGI server. Requests beyond `threads` wait in the
+    loop without holding a thread.
+
+    Bodies built in memory are sent by the loop once the thread is done.
+    Every chunk of a streamed body is handed to the loop and awaited before
+    the next one is produced, which keeps a slow client from buffering a
+    whole export, and the iterator is closed as soon as the client leaves.
+
+    `on_shutdown` callables run when the server announces its shutdown.
+    """
+    def __init__(self, app, threads=32, spool_size=1024 * 1024, on_shutdown=()):
+        self.app = app
+        self.threads = threads
+        self.spool_size = spool_size
+        self.on_shutdown = list(on_shutdown)
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='asgi')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http':
+            await self.handle(scope, receive, send)
+        elif scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        else:
+            raise ValueError(f"Unsupported ASGI scope type: {scope['type']}")
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=True)
+                for callback in self.on_shutdown:
+                    callback()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def handle(self, scope, receive, send):
+        body = tempfile.SpooledTemporaryFile(max_size=self.spool_size)
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                body.close()
+                return
+            body.write(message.get('body', b''))
+            more_body = message.get('more_body', False)
+        body.seek(0)
+
+        loop = asyncio.get_running_loop()
+        disconnected = threading.Event()
+
+        async def watch_disconnect():
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+            disconnected.set()
+
+        watcher = loop.create_task(watch_disconnect())
+        try:
+            buffered = await loop.run_in_executor(
+                self.executor, self.run, self.environ(scope, body), loop, send, disconnected)
+        finally:
+            watcher.cancel()
+            body.close()
+        if buffered is not None:
+            status, headers, content = buffered
+            await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+            await send({'type': 'http.response.body', 'body': content})
+
+    def run(self, environ, loop, send, disconnected):
+        """ calls the application in a pool thread
+        :return: (status, headers, body) for responses the application built
+            in memory, None once a streamed response has been relayed
+        """
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and response.get('sent'):
+                raise exc_info[1].with_traceback(exc_info[2])
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                                   for name, value in headers]
+
+        def relay(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        chunks = self.app(environ, start_response)
+        if isinstance(chunks, (list, tuple)):
+            return response['status'], response['headers'], b''.join(chunks)
+        try:
+            for chunk in chunks:
+                if disconnected.is_set():
+                    return
+                if not chunk:
+                    continue
+                if not response.get('sent'):
+                    relay({'type': 'http.response.start', 'status': response['status'],
+                           'headers': response['headers']})
+                    response['sent'] = True
+                relay({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            if not response.get('sent'):
+                relay({'type': 'http.response.start', 'status': response['status'],
+                       'headers': response['headers']})
+            relay({'type': 'http.response.body', 'body': b''})
+        except Exception as ex:
+            if not disconnected.is_set():
+                LOG.error(ex)
+                raise
+        finally:
+            if hasattr(chunks, 'close'):
+                chunks.close()
+
+    def environ(self, scope, body):
+        server_name, server_port = scope.get('server') or ('localhost', 80)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+            # ASGI paths are already percent-decoded; WSGI wants them as latin-1.
+            'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+            'QUERY_STRING': scope['query_string'].decode('latin-1'),
+            'SERVER_NAME': server_name,
+            'SERVER_PORT': str(server_port),
+            'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': body,
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+        }
+        if scope.get('client'):
+            environ['REMOTE_ADDR'] = scope['client'][0]
+        for name, value in scope.get('headers', []):
+            name = name.decode('latin-1').upper().replace('-', '_')
+            value = value.decode('latin-1')
+            if name == 'CONTENT_TYPE' or name == 'CONTENT_LENGTH':
+                key = name
+            else:
+                key = f'HTTP_{name}'
+            environ[key] = f'{environ[key]},{value}' if key in environ else value
+        if 'CONTENT_LENGTH' not in environ:
+            # Chunked uploads were buffered above, so the length is known.
+            environ['CONTENT_LENGTH'] = str(body.seek(0, 2))
+            body.seek(0)
+        return environ
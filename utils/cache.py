@@ -0,0 +1,95 @@
+import threading
+import time
+from collections import OrderedDict
+
+class LRUCache(object):
+    """Thread-safe LRU mapping bounded by size, with per-entry expiry.
+
+    `maxsize` counts entries, or with `weigh` the sum of `weigh(value)` over
+    the entries (e.g. rows), so a few large values can't outgrow it; a value
+    heavier than `maxsize` is not kept.
+
+    `generation` changes on every invalidation; passing the generation read
+    before a lookup to `set` keeps a result computed before a concurrent
+    invalidation from being stored.
+    """
+    def __init__(self, maxsize=1024, ttl=None, clock=time.monotonic, weigh=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.weigh = weigh or (lambda value: 1)
+        self.generation = 0
+        self._data = OrderedDict()
+        self._weight = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self._misses += 1
+                return default
+            expires_at, value, weight = entry
+            if expires_at is not None and expires_at <= self.clock():
+                del self._data[key]
+                self._weight -= weight
+                self._expirations += 1
+                self._misses += 1
+                return default
+            self._data.move_to_end(key)
+            self._hits += 1
+            return value
+
+    def set(self, key, value, ttl=None, generation=None):
+        if self.maxsize <= 0:
+            return
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = self.clock() + ttl if ttl else None
+        weight = self.weigh(value)
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            previous = self._data.pop(key, None)
+            if previous is not None:
+                self._weight -= previous[2]
+            if weight > self.maxsize:
+                return
+            self._data[key] = (expires_at, value, weight)
+            self._weight += weight
+            while self._weight > self.maxsize:
+                _, (_, _, evicted) = self._data.popitem(last=False)
+                self._weight -= evicted
+                self._evictions += 1
+
+    def pop(self, key):
+        with self._lock:
+            self.generation += 1
+            entry = self._data.pop(key, None)
+            if entry is not None:
+                self._weight -= entry[2]
+        return entry[1] if entry else None
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._data.clear()
+            self._weight = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._data),
+                'weight': self._weight,
+                'maxsize': self.maxsize,
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+                'expirations': self._expirations,
+            }
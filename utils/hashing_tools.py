@@ -1,18 +1,97 @@
 import hashlib
+import hmac
+import multiprocessing
+import os
 import random
 import string
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from conf.config import PASSWORD_HASH_ALGORITHM, PASSWORD_HASH_COST, PASSWORD_HASH_WORKERS
+
+# Stored formats:
+#   legacy:         '<sha256 hex>,<salt>'
+#   pbkdf2_sha256:  'pbkdf2_sha256$<iterations>$<salt>$<hash hex>'
+#   scrypt:         'scrypt$<n>$<salt>$<hash hex>' (r=8, p=1)
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+# At most two hashes queued per worker; further callers wait their turn.
+_slots = threading.BoundedSemaphore(max(PASSWORD_HASH_WORKERS, 1) * 2)
 
 def making_salt():
     return ''.join([random.choice(string.ascii_letters) for x in range(5)])
 
+def derive(algorithm, password, salt, cost):
+    """Runs the key-derivation function; executed in the hashing pool."""
+    if algorithm == 'pbkdf2_sha256':
+        return hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt.encode('utf-8'), cost).hex()
+    if algorithm == 'scrypt':
+        return hashlib.scrypt(password.encode('utf-8'), salt=salt.encode('utf-8'), n=cost, r=8, p=1,
+                              maxmem=256 * cost * 8 + 1024 * 1024).hex()
+    raise ValueError(f"Unknown password hashing algorithm: {algorithm}")
+
+def check_settings(algorithm, cost):
+    """Raises ValueError for settings every hash would fail with."""
+    if algorithm not in ('pbkdf2_sha256', 'scrypt'):
+        raise ValueError(f"Unknown password hashing algorithm: {algorithm}")
+    if cost < 1:
+        raise ValueError(f"PASSWORD_HASH_COST must be positive, got {cost}")
+    if algorithm == 'scrypt' and (cost < 2 or cost & (cost - 1)):
+        raise ValueError(f"PASSWORD_HASH_COST must be a power of 2 above 1 for scrypt, got {cost}")
+
+# Fail on startup rather than on every login.
+check_settings(PASSWORD_HASH_ALGORITHM, PASSWORD_HASH_COST)
+
+def get_pool():
+    global _pool, _pool_pid
+    with _pool_lock:
+        # A forked worker cannot use its parent's processes.
+        if _pool is None or _pool_pid != os.getpid():
+            # Forking a process that already runs threads (any threaded or
+            # ASGI server) can copy a lock mid-use into the child, so the
+            # workers come from a clean fork server where there is one.
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else None)
+            _pool = ProcessPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, mp_context=context)
+            _pool_pid = os.getpid()
+        return _pool
+
+def shutdown_pool():
+    """ stops the hashing processes, for servers that exit without running atexit """
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.shutdown(wait=True)
+        _pool = None
+
+def run_derive(algorithm, password, salt, cost):
+    if PASSWORD_HASH_WORKERS <= 0:
+        return derive(algorithm, password, salt, cost)
+    with _slots:
+        return get_pool().submit(derive, algorithm, password, salt, cost).result()
+
 def make_password_hashing(password, salt=None):
+    salt = salt or os.urandom(16).hex()
+    hash_ = run_derive(PASSWORD_HASH_ALGORITHM, password, salt, PASSWORD_HASH_COST)
+    return f'{PASSWORD_HASH_ALGORITHM}${PASSWORD_HASH_COST}${salt}${hash_}'
+
+def make_legacy_password_hashing(password, salt=None):
     if not salt:
         salt = making_salt()
     hash_ = hashlib.sha256(str.encode(password + salt)).hexdigest()
     return f'{hash_},{salt}'
 
 def checking_password_hash(password, hash_):
-    salt = hash_.split(',')[1]
-    if make_password_hashing(password, salt) == hash_:
-        return True
-    return False
+    if '$' not in hash_:
+        expected = make_legacy_password_hashing(password, hash_.split(',')[1])
+        return hmac.compare_digest(expected, hash_)
+
+    algorithm, cost, salt, stored = hash_.split('$')
+    derived = run_derive(algorithm, password, salt, int(cost))
+    return hmac.compare_digest(derived, stored)
+
+def needs_rehash(hash_):
+    """True when hash_ was not made with the current algorithm and cost."""
+    return not hash_.startswith(f'{PASSWORD_HASH_ALGORITHM}${PASSWORD_HASH_COST}$')
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""JSON encoding and decoding with the fastest codec available.
+
+The codec is chosen once at import time: orjson when it is installed and
+JSON_CODEC allows it, the standard library otherwise. `dumps` always returns
+UTF-8 bytes and both codecs serialize `datetime` values as ISO 8601.
+"""
+import datetime
+import json
+
+from conf.config import JSON_CODEC, LOG
+
+orjson = None
+if JSON_CODEC in ('auto', 'orjson'):
+    try:
+        import orjson
+    except ImportError:
+        if JSON_CODEC == 'orjson':
+            raise
+
+def _default(obj):
+    if isinstance(obj, (datetime.datetime, datetime.date)):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+if orjson is not None:
+    CODEC = 'orjson'
+
+    def dumps(obj):
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+
+    loads = orjson.loads
+else:
+    CODEC = 'json'
+    _encoder = json.JSONEncoder(default=_default)
+
+    def dumps(obj):
+        return _encoder.encode(obj).encode('utf-8')
+
+    loads = json.loads
+
+LOG.debug(f'JSON codec: {CODEC}')
@@ -0,0 +1,208 @@
+import hashlib
+import threading
+import time
+from bisect import bisect_left
+
+clock = time.perf_counter
+
+# Upper bounds (seconds) of the latency histogram buckets, +Inf is implied.
+# Parts of a request timed by middleware.RequestMetrics; they add up to its
+# duration. Code timing a phase passes its index to Metrics.add_phase.
+PHASES = ('middleware', 'jwt', 'db', 'serialization', 'handler')
+MIDDLEWARE, JWT, DB, SERIALIZATION, HANDLER = range(len(PHASES))
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+class Shard(object):
+    """Histograms and summaries written by a single thread."""
+    __slots__ = ('thread', 'histograms')
+
+    def __init__(self, thread):
+        self.thread = thread
+        # histogram key -> per-bucket counts (the last one is +Inf) then the sum
+        # summary key -> count then one sum per field
+        self.histograms = {}
+
+class Metrics(object):
+    """Latency histograms aggregated per thread and merged when read.
+
+    Every thread records into its own `Shard`, so observing takes no lock;
+    the only lock is taken when a thread records for the first time and when
+    the shards are read. Shards of threads that have exited are folded into
+    one so thread-per-request servers do not grow the list forever.
+
+    A key is the metric name followed by its label values, e.g.
+    `('http_request_duration_seconds', 'GET', '/api/astronauts', '200')`;
+    `describe` gives the help text and the label names. Histograms are
+    recorded with `observe`; summaries (a count and sums, no quantiles) with
+    `accumulate`, which adds several related sums at once, one per value of
+    the summary's `field` label.
+
+    Phase timings (`add_phase`) accumulate into the request currently handled
+    by the calling thread, see middleware.RequestMetrics.
+    """
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = tuple(buckets)
+        self.metrics = {}
+        self.collectors = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = []
+        self._retired = Shard(None)
+        self._folded_at = 0
+
+    def describe(self, name, help_text, labels, field=None):
+        """ :param field: (label, values) for summaries, None for histograms """
+        self.metrics[name] = (help_text, tuple(labels), field)
+
+    def collector(self, name, help_text, labels, collect):
+        """ registers a gauge read when the metrics are rendered
+        :param collect: callable returning {label values tuple: value}
+        """
+        self.collectors.append((name, help_text, tuple(labels), collect))
+
+    def _shard(self):
+        shard = Shard(threading.current_thread())
+        with self._lock:
+            self._shards.append(shard)
+            if len(self._shards) >= 2 * self._folded_at + 64:
+                self._fold()
+                self._folded_at = len(self._shards)
+        self._local.shard = shard
+        return shard
+
+    def _fold(self):
+        """ merges the shards of finished threads, must hold the lock """
+        alive = []
+        for shard in self._shards:
+            if shard.thread.is_alive():
+                alive.append(shard)
+            else:
+                merge(self._retired.histograms, shard.histograms)
+        self._shards = alive
+
+    def observe(self, key, seconds):
+        try:
+            histograms = self._local.shard.histograms
+        except AttributeError:
+            histograms = self._shard().histograms
+        counts = histograms.get(key)
+        if counts is None:
+            counts = histograms[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        counts[bisect_left(self.buckets, seconds)] += 1
+        counts[-1] += seconds
+
+    def accumulate(self, key, values):
+        try:
+            histograms = self._local.shard.histograms
+        except AttributeError:
+            histograms = self._shard().histograms
+        sums = histograms.get(key)
+        if sums is None:
+            sums = histograms[key] = [0] + [0.0] * len(values)
+        sums[0] += 1
+        for i, value in enumerate(values, 1):
+            sums[i] += value
+
+    def start_request(self):
+        """ starts collecting phases for the calling thread's request """
+        self._local.phases = [0.0] * len(PHASES)
+
+    def finish_request(self):
+        """ :return: seconds per PHASES index collected since start_request, or None """
+        phases, self._local.phases = getattr(self._local, 'phases', None), None
+        return phases
+
+    def add_phase(self, phase, seconds):
+        """ adds to a phase of the current request, if any """
+        try:
+            self._local.phases[phase] += seconds
+        except (AttributeError, TypeError):
+            pass
+
+    def snapshot(self):
+        """ :return: key -> merged bucket counts and sum """
+        with self._lock:
+            self._fold()
+            merged = {}
+            merge(merged, self._retired.histograms)
+            for shard in self._shards:
+                merge(merged, shard.histograms)
+        return merged
+
+    def render(self):
+        """ the metrics in the Prometheus text exposition format """
+        lines = []
+        snapshot = self.snapshot()
+        for name, (help_text, labels, field) in self.metrics.items():
+            lines += [f'# HELP {name} {help_text}', f"# TYPE {name} {'summary' if field else 'histogram'}"]
+            for key in sorted(k for k in snapshot if k[0] == name):
+                counts = snapshot[key]
+                pairs = [f'{label}="{escape(value)}"' for label, value in zip(labels, key[1:])]
+                if field:
+                    label, values = field
+                    for value, total in zip(values, counts[1:]):
+                        field_pairs = ','.join(pairs + [f'{label}="{value}"'])
+                        lines.append(f'{name}_sum{{{field_pairs}}} {total!r}')
+                        lines.append(f'{name}_count{{{field_pairs}}} {counts[0]}')
+                    continue
+                total = 0
+                for bound, count in zip(self.buckets + ('+Inf', ), counts):
+                    total += count
+                    le = ','.join(pairs + [f'le="{bound}"'])
+                    lines.append(f'{name}_bucket{{{le}}} {total}')
+                lines.append(f"{name}_sum{{{','.join(pairs)}}} {counts[-1]!r}")
+                lines.append(f"{name}_count{{{','.join(pairs)}}} {total}")
+        for name, help_text, labels, collect in self.collectors:
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} gauge']
+            for values, value in sorted(collect().items()):
+                pairs = ','.join(f'{label}="{escape(v)}"' for label, v in zip(labels, values))
+                lines.append(f'{name}{{{pairs}}} {value}')
+        return '\n'.join(lines) + '\n'
+
+class Timer(object):
+    """ `with Timer(metrics, key, phase):` observes how long the block took
+        under `key` and adds it to the current request's `phase` (an index
+        of PHASES) """
+    __slots__ = ('metrics', 'key', 'phase', 'started')
+
+    def __init__(self, metrics, key, phase=None):
+        self.metrics = metrics
+        self.key = key
+        self.phase = phase
+
+    def __enter__(self):
+        self.started = clock()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = clock() - self.started
+        self.metrics.observe(self.key, elapsed)
+        if self.phase is not None:
+            self.metrics.add_phase(self.phase, elapsed)
+
+def merge(into, histograms):
+    for key, counts in list(histograms.items()):
+        total = into.get(key)
+        if total is None:
+            into[key] = list(counts)
+        else:
+            for i, count in enumerate(counts):
+                total[i] += count
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def shape_id(statement):
+    """ short stable label for a parameterized SQL statement """
+    return hashlib.blake2b(statement.encode('utf-8'), digest_size=6).hexdigest()
+
+metrics = Metrics()
+metrics.describe('http_request_duration_seconds',
+                 'Time from the first middleware to the response being ready.',
+                 ['method', 'route', 'status'])
+metrics.describe('http_request_phase_seconds',
+                 'Time spent by requests in each phase, see middleware.RequestMetrics.',
+                 ['route'], field=('phase', PHASES))
+metrics.describe('db_query_duration_seconds',
+                 'Time spent running a statement and fetching its rows, by data layer function and statement.',
+                 ['operation', 'shape'])
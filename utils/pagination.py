@@ -0,0 +1,22 @@
+import base64
+import json
+
+def encode_cursor(sort, values):
+    """Opaque keyset cursor: the sort key and the values of the last row."""
+    raw = json.dumps({'s': sort, 'v': list(values)}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    """Returns (sort, values) or raises ValueError for a malformed cursor."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        data = json.loads(raw.decode('utf-8'))
+        sort, values = data['s'], data['v']
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor}")
+    if not isinstance(sort, str) or not isinstance(values, list):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    # They are bound as parameters and are part of cache keys.
+    if not all(isinstance(value, (str, int)) and not isinstance(value, bool) for value in values):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return sort, values